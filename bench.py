@@ -0,0 +1,344 @@
+"""Benchmarks, run with `python bench.py`.
+
+Besides the Intcode VM benchmarks, there's a suite covering every day's
+solvers, on the real inputs and on synthetic ones scaled up by --scale.
+--save writes the suite's timings as a baseline, and --compare reports the
+ratio to one, flagging and failing on any slower than --threshold allows.
+"""
+import argparse
+import asyncio
+import importlib
+import itertools
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from array import array
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import intcode
+import intcode.image
+from intcode import aio
+
+# Instructions per second the shared Intcode VM should sustain on the day 9
+# part 2 workload (371205 instructions). The original per-day VMs managed
+# about 0.2M.
+TARGET_IPS = 1_000_000
+
+
+def bench_intcode(jit_blocks: bool = False, repeat: int = 5) -> float:
+    """Return the best instructions per second on day 9 part 2."""
+    with open("input/09.txt") as f:
+        program = intcode.parse(f.read())
+
+    best = 0.0
+    for _ in range(repeat):
+        vm = intcode.VirtualMachine(jit_blocks)
+        vm.load(program)
+        vm.push_input(2)
+        start = time.perf_counter()
+        vm.exhaust()
+        best = max(best, vm.steps / (time.perf_counter() - start))
+    return best
+
+
+def load_flat(program: List[int]) -> List[int]:
+    """Load a program the way the VM did before paging."""
+    mem = [0] * 10000
+    mem[:len(program)] = program[:]
+    return mem
+
+
+def per_load(load: Callable[[List[int]], Any],
+             program: List[int],
+             n: int = 1000) -> Any:
+    """Return the seconds and bytes each load of program costs."""
+    start = time.perf_counter()
+    for _ in range(n):
+        load(program)
+    seconds = (time.perf_counter() - start) / n
+    tracemalloc.start()
+    kept = [load(program) for _ in range(n)]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del kept
+    return seconds, size / n
+
+
+def bench_memory() -> None:
+    """Compare loading day 9 into a flat list and into paged memory."""
+    with open("input/09.txt") as f:
+        program = intcode.parse(f.read())
+
+    for name, load in (("flat", load_flat), ("paged", intcode.Memory)):
+        seconds, size = per_load(load, program)
+        print(f"memory ({name}): {seconds * 1e6:.1f} us and "
+              f"{size / 1024:.1f} KiB per load")
+    # Values computed at run time are each their own object in a list, but
+    # unboxed in an int64 page.
+    big = [2**40 + i for i in range(intcode.PAGE_SIZE)]
+    for name, fill in (("list", list), ("int64", lambda v: array("q", v))):
+        tracemalloc.start()
+        pages = [fill([v + i for v in big]) for i in range(100)]
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del pages
+        print(f"memory ({name} page): {size / 100 / 1024:.1f} KiB per page "
+              "of large values")
+
+
+def bench_load(cells: int = 1_000_000) -> None:
+    """Compare reading a big program as text and as an image."""
+    rng = random.Random(16)
+    program = [rng.randrange(-10**6, 10**6) for _ in range(cells)]
+    program[::1000] = [2**70] * len(program[::1000])  # Some overflow.
+    with tempfile.TemporaryDirectory() as tmp:
+        text, image = os.path.join(tmp, "text"), os.path.join(tmp, "image")
+        with open(text, "w") as f:
+            f.write(",".join(map(str, program)))
+        intcode.image.convert(text, image)
+        for name, path in (("text", text), ("image", image)):
+            start = time.perf_counter()
+            intcode.image.CACHE.clear()
+            intcode.read_program(path)
+            seconds = time.perf_counter() - start
+            start = time.perf_counter()
+            intcode.read_program(path)
+            cached = time.perf_counter() - start
+            print(f"load ({name}): {seconds * 1e3:.0f} ms for {cells:,} "
+                  f"cells, {cached * 1e3:.0f} ms cached")
+
+
+async def feedback_networks(program: List[int], networks: int) -> int:
+    """Run networks day 7 feedback loops at once, five VMs each, and return
+    the best signal."""
+    warm = intcode.warm_start(program)
+    phases = itertools.cycle(itertools.permutations(range(5, 10)))
+    firsts = []
+    tasks = []
+    for permutation in itertools.islice(phases, networks):
+        wires: List[asyncio.Queue[int]] = [asyncio.Queue() for _ in range(5)]
+        for link, phase in zip(wires, permutation):
+            link.put_nowait(phase)
+        wires[0].put_nowait(0)
+        for i, link in enumerate(wires):
+            sink = wires[(i + 1) % len(wires)]
+            tasks.append(aio.run(warm.fork(), link.get, sink.put))
+        firsts.append(wires[0])
+    await asyncio.gather(*tasks)
+    return max(first.get_nowait() for first in firsts)
+
+
+def bench_aio() -> None:
+    """Show how running VMs as asyncio tasks scales with their number."""
+    with open("input/07.txt") as f:
+        program = intcode.parse(f.read())
+
+    for networks in (10, 100, 1000):
+        start = time.perf_counter()
+        asyncio.run(feedback_networks(program, networks))
+        seconds = time.perf_counter() - start
+        print(f"aio: {5 * networks} VMs in {seconds * 1e3:.0f} ms, "
+              f"{seconds / networks * 1e3:.2f} ms per network")
+
+
+def day(n: int) -> Any:
+    """Import a day's solvers, which live with its tests."""
+    return importlib.import_module(f"test_day{n:02}")
+
+
+def day_program(n: int) -> List[int]:
+    return intcode.read_program(f"input/{n:02}.txt")
+
+
+def masses(n: int) -> List[int]:
+    """Random module masses, like day 1's."""
+    rng = random.Random(1)
+    return [rng.randrange(50000, 150000) for _ in range(n)]
+
+
+def wire(segments: int, seed: int) -> str:
+    """A random wire, like day 3's."""
+    rng = random.Random(seed)
+    return ",".join(f"{rng.choice('RULD')}{rng.randrange(1, 100)}"
+                    for _ in range(segments))
+
+
+def orbits(n: int) -> str:
+    """A random orbit map of n objects plus YOU and SAN, like day 6's. Each
+    object orbits one of the ten before it, so the map is deep."""
+    rng = random.Random(6)
+    names = ["COM"] + [f"O{i}" for i in range(1, n)]
+    lines = [
+        f"{names[rng.randrange(max(0, i - 10), i)]}){names[i]}"
+        for i in range(1, n)
+    ]
+    lines += [f"{rng.choice(names)})YOU", f"{rng.choice(names)})SAN"]
+    return "\n".join(lines)
+
+
+def layers(n: int) -> List[int]:
+    """The digits of a random 25x6 image of n layers, like day 8's."""
+    rng = random.Random(8)
+    return [rng.choice((0, 1, 2, 2, 2)) for _ in range(25 * 6 * n)]
+
+
+def layer_text(n: int) -> str:
+    """Like layers(), as the digit string the NumPy path reads. Needs it."""
+    importlib.import_module("numpy")
+    return "".join(map(str, layers(n)))
+
+
+def countdown(n: int) -> List[int]:
+    """An Intcode program looping n times, 2 instructions a time."""
+    return [1001, 8, -1, 8, 1005, 8, 0, 99, n]
+
+
+def run_intcode(program: List[int], *inputs: int) -> List[int]:
+    vm = intcode.VirtualMachine()
+    vm.load(program)
+    for value in inputs:
+        vm.push_input(value)
+    vm.exhaust()
+    return list(vm.drain())
+
+
+def gravity_assist(program: List[int]) -> int:
+    """Day 2 part 1, run as test_solution_part_1 does."""
+    vm = day(2).VirtualMachine()
+    vm.load(program)
+    vm.write(1, 12)
+    vm.write(2, 2)
+    vm.execute()
+    return int(vm.read(0))
+
+
+def fuel(modules: List[int]) -> int:
+    return sum(map(day(1).fuel_required_accurate, modules))
+
+
+def orbit_data(n: int) -> Any:
+    return day(6).parse(orbits(n))
+
+
+# What to time, by name: a solver, and a function of the scale returning its
+# arguments. Arguments are made before timing starts.
+SUITE: Dict[str, Tuple[Callable[..., Any], Callable[[int], Tuple[Any, ...]]]]
+SUITE = {
+    "day01 fuel_required_accurate": (fuel, lambda scale:
+                                     (masses(1000 * scale), )),
+    "day02 part_1": (gravity_assist, lambda _: (day_program(2), )),
+    "day02 find_desired_output":
+    (lambda p: day(2).find_desired_output(p, 19690720), lambda _:
+     (day_program(2), )),
+    "day03 part_1": (lambda *w: day(3).part_1(*w), lambda scale:
+                     (wire(30 * scale, 1), wire(30 * scale, 2))),
+    "day03 part_2": (lambda *w: day(3).part_2(*w), lambda scale:
+                     (wire(30 * scale, 1), wire(30 * scale, 2))),
+    "day04 part_1": (lambda *r: day(4).part_1(*r), lambda scale:
+                     (246540, 246540 + 10000 * scale)),
+    "day04 part_2": (lambda *r: day(4).part_2(*r), lambda scale:
+                     (246540, 246540 + 10000 * scale)),
+    "day05 part_2": (run_intcode, lambda _: (day_program(5), 5)),
+    "day06 part_1": (lambda d: day(6).part_1(d), lambda scale:
+                     (orbit_data(100 * scale), )),
+    "day06 part_2": (lambda d: day(6).part_2(d), lambda scale:
+                     (orbit_data(100 * scale), )),
+    "day07 part_1": (lambda p: day(7).part_1(p), lambda _: (day_program(7), )),
+    "day07 part_2": (lambda p: day(7).part_2(p), lambda _: (day_program(7), )),
+    "day08 part_1": (lambda *i: day(8).part_1(*i), lambda scale:
+                     (layers(100 * scale), 25, 6)),
+    "day08 collapse": (lambda *i: day(8).part_2(*i), lambda scale:
+                       (layers(100 * scale), 25, 6)),
+    "day08 part_1 numpy": (lambda *i: day(8).part_1_numpy(*i), lambda scale:
+                           (layer_text(100 * scale), 25, 6)),
+    "day08 collapse numpy": (lambda *i: day(8).part_2_numpy(*i), lambda scale:
+                             (layer_text(100 * scale), 25, 6)),
+    "day09 part_2": (run_intcode, lambda _: (day_program(9), 2)),
+    "intcode countdown": (run_intcode, lambda scale:
+                          (countdown(10000 * scale), )),
+}
+
+
+def bench_suite(scale: int, repeat: int = 3) -> Dict[str, float]:
+    """Time everything in SUITE, and return the best seconds of each."""
+    seconds = {}
+    for name, (solver, inputs) in SUITE.items():
+        try:
+            args = inputs(scale)
+            best = float("inf")
+            for _ in range(repeat):
+                start = time.perf_counter()
+                solver(*args)
+                best = min(best, time.perf_counter() - start)
+        except ImportError as e:
+            print(f"{name}: skipped, {e}")
+            continue
+        seconds[name] = best
+        print(f"{name}: {best * 1e3:.2f} ms")
+    return seconds
+
+
+def compare(seconds: Dict[str, float], path: str, scale: int,
+            threshold: float) -> bool:
+    """Compare seconds to the baseline at path, and return whether none
+    regressed by more than threshold, as a fraction."""
+    with open(path) as f:
+        baseline = json.load(f)
+    if baseline["scale"] != scale:
+        raise RuntimeError(f"baseline is at scale {baseline['scale']}")
+    ok = True
+    for name, before in baseline["seconds"].items():
+        after = seconds.get(name)
+        if after is None:
+            print(f"{name}: missing")
+            continue
+        ratio = after / before
+        regressed = ratio > 1 + threshold
+        ok = ok and not regressed
+        print(f"{name}: {before * 1e3:.2f} -> {after * 1e3:.2f} ms, "
+              f"x{ratio:.2f}{' REGRESSED' if regressed else ''}")
+    return ok
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale",
+                        type=int,
+                        default=1,
+                        help="grow the synthetic inputs by this factor")
+    parser.add_argument("--save", help="save the suite's timings here")
+    parser.add_argument("--compare", help="compare against timings saved here")
+    parser.add_argument("--threshold",
+                        type=float,
+                        default=0.1,
+                        help="the slowdown counted as a regression")
+    parser.add_argument("--suite-only",
+                        action="store_true",
+                        help="skip the Intcode VM benchmarks")
+    args = parser.parse_args(argv)
+
+    if not args.suite_only:
+        for jit_blocks in (False, True):
+            ips = bench_intcode(jit_blocks)
+            verdict = "ok" if ips >= TARGET_IPS else "BELOW TARGET"
+            name = "intcode (jit blocks)" if jit_blocks else "intcode"
+            print(f"{name}: {ips:,.0f} instructions/s "
+                  f"(target {TARGET_IPS:,}) {verdict}")
+        bench_memory()
+        bench_load()
+        bench_aio()
+    seconds = bench_suite(args.scale)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"scale": args.scale, "seconds": seconds}, f, indent=2)
+    if args.compare and not compare(seconds, args.compare, args.scale,
+                                    args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
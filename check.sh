@@ -4,4 +4,4 @@ mypy --strict .
 echo "==> yapf <=="
 yapf --recursive --diff .
 echo "==> pylint <=="
-pylint --disable=C0103,C0114,C0115,C0116,C0301 --score=no --jobs=0 *.py
+pylint --disable=C0103,C0114,C0115,C0116,C0301 --score=no --jobs=0 *.py intcode
@@ -0,0 +1,25 @@
+"""The Intcode computer shared by every day that needs one."""
+from intcode.channel import Channel, ThreadSafeChannel
+from intcode.image import read_program
+from intcode.memory import PAGE_SIZE, Memory
+from intcode.ops import ARITY, Mode, Op, State
+from intcode.profiler import Profile
+from intcode.scheduler import Scheduler
+from intcode.vm import VirtualMachine, parse, warm_start
+
+__all__ = [
+    "ARITY",
+    "Channel",
+    "Memory",
+    "Mode",
+    "Op",
+    "PAGE_SIZE",
+    "Profile",
+    "Scheduler",
+    "State",
+    "ThreadSafeChannel",
+    "VirtualMachine",
+    "parse",
+    "read_program",
+    "warm_start",
+]
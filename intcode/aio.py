@@ -0,0 +1,44 @@
+"""Run VMs as asyncio tasks.
+
+run() awaits its source only when the VM needs input, and awaits its sink
+for every output, so VMs wired together through asyncio queues, sockets or
+files share one event loop without polling. A blocked VM costs nothing
+until its source has a value. A VM that doesn't block yields to the loop
+after each quantum instead, and sends the outputs it has so far.
+"""
+import asyncio
+from typing import Awaitable, Callable, Optional
+
+from intcode.ops import State
+from intcode.vm import VirtualMachine
+
+# Where a VM gets its input, like asyncio.Queue.get.
+Source = Callable[[], Awaitable[int]]
+# Where a VM sends its output, like asyncio.Queue.put.
+Sink = Callable[[int], Awaitable[None]]
+
+# Instructions run between yields to the loop, a few milliseconds' worth.
+QUANTUM = 10000
+
+
+async def run(vm: VirtualMachine,
+              source: Source,
+              sink: Sink,
+              quantum: Optional[int] = QUANTUM) -> None:
+    """Run vm until it halts. Input already pushed is used first. With
+    quantum None, only yield to the loop when blocked."""
+    vm.quantum = quantum
+    execution = vm.execute()
+    while True:
+        state = next(execution)
+        # Outputs wait in vm.output until the VM stops, which is always
+        # before it would need anything the sink's reader sends back, and
+        # at least once a quantum.
+        for value in vm.drain():
+            await sink(value)
+        if state == State.HALTED:
+            return
+        if state == State.PREEMPTED:
+            await asyncio.sleep(0)
+            continue
+        vm.push_input(await source())
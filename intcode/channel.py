@@ -0,0 +1,71 @@
+"""Channels carry values into and out of VMs, and between them."""
+import collections
+import threading
+from typing import Deque, Iterable, Optional
+
+
+class Channel(Deque[int]):
+    """A FIFO for single-threaded, cooperative use, like simulate() stepping
+    VMs in turn. It's a deque, so nothing takes a lock."""
+
+    put = collections.deque.append
+    get = collections.deque.popleft
+
+    def empty(self) -> bool:
+        return not self
+
+    def push_many(self, values: Iterable[int]) -> None:
+        self.extend(values)
+
+    def drain_into(self, other: "Channel") -> int:
+        """Move every value into other, and return how many there were."""
+        n = len(self)
+        other.push_many(self)
+        self.clear()
+        return n
+
+    def wait(self, timeout: Optional[float] = None) -> None:
+        """Wait for a value. With one thread, nothing else can put one."""
+        del timeout  # So there's never anything to wait for.
+        if not self:
+            raise RuntimeError("waiting on an empty channel")
+
+
+class ThreadSafeChannel(Channel):
+    """A Channel for VMs running on real threads. Every operation takes a
+    lock, and wait() blocks until another thread puts a value."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.ready = threading.Condition()
+
+    def put(self, value: int) -> None:
+        with self.ready:
+            self.append(value)
+            self.ready.notify_all()
+
+    def get(self) -> int:
+        with self.ready:
+            return self.popleft()
+
+    def empty(self) -> bool:
+        with self.ready:
+            return not self
+
+    def push_many(self, values: Iterable[int]) -> None:
+        values = list(values)  # Not under our lock, in case it's another.
+        with self.ready:
+            self.extend(values)
+            self.ready.notify_all()
+
+    def drain_into(self, other: Channel) -> int:
+        with self.ready:
+            values = list(self)
+            self.clear()
+        other.push_many(values)
+        return len(values)
+
+    def wait(self, timeout: Optional[float] = None) -> None:
+        with self.ready:
+            if not self.ready.wait_for(lambda: len(self) > 0, timeout):
+                raise RuntimeError("timed out waiting on a channel")
@@ -0,0 +1,99 @@
+"""Binary program images, and a cached loader for programs on disk.
+
+An image is a header, then every cell as a little-endian int64, then the
+cells that don't fit in one. Those are stored as 0 in the array, and again
+after it as (index, length, signed little-endian bytes). Loading one copies
+the array out of an mmap in C, with no Python work per cell.
+
+Convert a program with `python -m intcode.image program.txt program.icim`.
+"""
+import array
+import hashlib
+import mmap
+import struct
+import sys
+from typing import Dict, List, Union
+
+from intcode.vm import parse
+
+MAGIC = b"ICIM"
+VERSION = 1
+# Magic, version, number of cells, number of overflow cells.
+HEADER = struct.Struct("<4sIQQ")
+# Index and byte length of an overflow cell, before its bytes.
+OVERFLOW = struct.Struct("<QI")
+
+INT64_MIN, INT64_MAX = -(1 << 63), (1 << 63) - 1
+
+# Programs read so far, by the SHA-256 of their file.
+CACHE: Dict[str, List[int]] = {}
+
+
+def dumps(program: List[int]) -> bytes:
+    cells = array.array("q")
+    overflow = []
+    for i, cell in enumerate(program):
+        if INT64_MIN <= cell <= INT64_MAX:
+            cells.append(cell)
+        else:
+            cells.append(0)
+            overflow.append((i, cell))
+    if sys.byteorder != "little":
+        cells.byteswap()
+    parts = [HEADER.pack(MAGIC, VERSION, len(cells), len(overflow))]
+    parts.append(cells.tobytes())
+    for i, cell in overflow:
+        data = cell.to_bytes((cell.bit_length() + 8) // 8,
+                             "little",
+                             signed=True)
+        parts += [OVERFLOW.pack(i, len(data)), data]
+    return b"".join(parts)
+
+
+def loads(data: Union[bytes, mmap.mmap, memoryview]) -> List[int]:
+    """Read an image, from bytes or anything else supporting the buffer
+    protocol, like an mmap."""
+    with memoryview(data) as view:
+        magic, version, count, overflows = HEADER.unpack_from(view)
+        if magic != MAGIC or version != VERSION:
+            raise RuntimeError(f"not an Intcode image, version {VERSION}")
+        end = HEADER.size + 8 * count
+        cells = array.array("q")
+        cells.frombytes(view[HEADER.size:end])
+        if sys.byteorder != "little":
+            cells.byteswap()
+        program = cells.tolist()
+        for _ in range(overflows):
+            i, length = OVERFLOW.unpack_from(view, end)
+            end += OVERFLOW.size
+            program[i] = int.from_bytes(view[end:end + length],
+                                        "little",
+                                        signed=True)
+            end += length
+    return program
+
+
+def convert(text_path: str, image_path: str) -> None:
+    """Write the program in text_path, comma-separated, as an image."""
+    with open(text_path) as f:
+        program = parse(f.read())
+    with open(image_path, "wb") as f:
+        f.write(dumps(program))
+
+
+def read_program(path: str) -> List[int]:
+    """Read a program, either an image or comma-separated text. Each file is
+    parsed once, and later reads of the same contents copy the result."""
+    with open(path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            key = hashlib.sha256(data).hexdigest()
+            if key not in CACHE:
+                if data[:len(MAGIC)] == MAGIC:
+                    CACHE[key] = loads(data)
+                else:
+                    CACHE[key] = parse(data[:].decode())
+    return CACHE[key][:]
+
+
+if __name__ == "__main__":
+    convert(sys.argv[1], sys.argv[2])
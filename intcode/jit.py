@@ -0,0 +1,161 @@
+"""Compile Intcode basic blocks into Python functions.
+
+A block runs straight-line code up to and including the first OUT, JIT or
+JIF, and stops before any SAV or HLT, which the driver handles itself since
+they interact with the execute() protocol. Addresses, immediates and
+relative-base arithmetic are inlined into the generated source.
+
+Every write checks whether it landed on code; if so, the block invalidates
+what it hit and returns, so it never runs stale instructions. Once any block
+gets overwritten, the program is self-modifying and further compiling is
+likely wasted, so the driver hands the rest of the run to the interpreter.
+"""
+from __future__ import annotations
+from typing import TYPE_CHECKING, Dict, Iterator, List, Tuple
+
+from intcode.memory import PAGE_BITS, PAGE_MASK, Block, Memory, decode
+from intcode.ops import (ADD, EQL, HLT, IRB, JIF, JIT, LTH, MUL, OUT, SAV,
+                         UNLIMITED, State)
+
+if TYPE_CHECKING:
+    from intcode.vm import VirtualMachine
+
+BINARY = {
+    ADD: "{} + {}",
+    MUL: "{} * {}",
+    LTH: "int({} < {})",
+    EQL: "int({} == {})",
+}
+
+
+def operand(mem: Memory, pc: int, nxt: int, addr: int, rel: int,
+            temp: str) -> Tuple[List[str], str]:
+    """Generate an expression for an operand of the instruction at pc, and
+    any statements it needs first, which may assign temp."""
+    if rel:
+        return [f"{temp} = rb + {addr}"], \
+            f"pages[{temp} >> {PAGE_BITS}][{temp} & {PAGE_MASK}]"
+    if pc < addr < nxt:
+        # Our own parameter, which can't change without invalidating us.
+        return [], repr(mem[addr])
+    return [], f"pages[{addr >> PAGE_BITS}][{addr & PAGE_MASK}]"
+
+
+def source(mem: Memory, start: int) -> Tuple[str, int]:
+    """Generate the source of the block at start, which defines block(), and
+    return it with the end of the block's code."""
+    body = []
+    pcs: List[int] = []  # Where each instruction starts.
+    pc = start
+    while mem[pc] % 100 not in (SAV, HLT):
+        try:
+            op, nxt, a, ar, b, br, c, cr = decode(mem, pc)
+        except RuntimeError:
+            if not pcs:
+                raise
+            break  # Maybe it's data, or code that isn't written yet.
+        n = len(pcs)
+        pcs.append(pc)
+        setup_x, x = operand(mem, pc, nxt, a, ar, "p")
+        setup_y, y = operand(mem, pc, nxt, b, br, "q")
+        body += [
+            f"# {pc}: {[mem[i] for i in range(pc, nxt)]}",
+            f"n = {n}",
+            *setup_x,
+            *setup_y,
+        ]
+        if op in BINARY:
+            if cr:
+                body += [
+                    f"d = rb + {c}",
+                    f"owned[d >> {PAGE_BITS}][d & {PAGE_MASK}] = "
+                    f"{BINARY[op].format(x, y)}",
+                ]
+            else:
+                body += [
+                    f"d = {c}",
+                    f"owned[{c >> PAGE_BITS}][{c & PAGE_MASK}] = "
+                    f"{BINARY[op].format(x, y)}",
+                ]
+            body += [
+                "if d in code:",
+                "    mem.invalidate(d)",
+                f"    return {nxt}, rb, {n + 1}",
+            ]
+        elif op == IRB:
+            body.append(f"rb += {x}")
+        elif op == OUT:
+            body.append(f"out.put({x})")
+        elif op == JIT:
+            body.append(f"return ({y} if {x} else {nxt}), rb, {n + 1}")
+        elif op == JIF:
+            body.append(f"return ({nxt} if {x} else {y}), rb, {n + 1}")
+        pc = nxt
+        if op in (OUT, JIT, JIF):
+            break
+    lines = [
+        "def block(mem, pages, owned, code, rb, out):",
+        "    try:",
+        *(f"        {line}" for line in body),
+        "    except KeyError as fault:",
+        "        # Nothing has changed since n, so map the page and retry.",
+        "        mem.fault(fault.args[0])",
+        f"        return {tuple(pcs)}[n], rb, n",
+        "    except OverflowError:",
+        "        # Likewise, after making room for the value written to d.",
+        "        mem.promote(d)",
+        f"        return {tuple(pcs)}[n], rb, n",
+    ]
+    if not body[-1].startswith("return"):
+        lines.append(f"    return {pc}, rb, {len(pcs)}")
+    return "\n".join(lines), pc
+
+
+def compile_block(mem: Memory, start: int) -> Block:
+    """Compile the block at start, and cache it."""
+    src, end = source(mem, start)
+    namespace: Dict[str, Block] = {}
+    code = compile(src, f"<block {start}>", "exec")
+    exec(code, namespace)  # pylint: disable=exec-used
+    block = namespace["block"]
+    mem.blocks[start] = (block, end)
+    mem.cover(start, end)
+    return block
+
+
+def execute(vm: VirtualMachine) -> Iterator[State]:
+    """Like VirtualMachine.interpret(), but running compiled blocks."""
+    mem, inp, out = vm.mem, vm.input, vm.output
+    pages, owned, code, blocks = mem.pages, mem.owned, mem.code, mem.blocks
+    pc, rb, steps = vm.pc, vm.rb, vm.steps
+    limit = steps + (vm.quantum or UNLIMITED)
+    while True:
+        entry = blocks.get(pc)
+        if entry is not None:
+            pc, rb, n = entry[0](mem, pages, owned, code, rb, out)
+            steps += n
+            if steps >= limit:
+                vm.pc, vm.rb, vm.steps = pc, rb, steps
+                yield State.PREEMPTED
+                limit = steps + (vm.quantum or UNLIMITED)
+            continue
+        op = mem[pc] % 100
+        if op == SAV:
+            if not inp:
+                vm.pc, vm.rb, vm.steps = pc, rb, steps
+                while not inp:
+                    yield State.BLOCKED
+            _, nxt, a, ar, *_ = mem.decoded.get(pc) or mem.decode(pc)
+            mem[a + rb * ar] = inp.get()
+            pc = nxt
+            steps += 1
+        elif op == HLT:
+            vm.pc, vm.rb, vm.steps = pc, rb, steps
+            while True:
+                yield State.HALTED
+        elif mem.unstable:
+            # The program rewrites its own code, so stop compiling it.
+            vm.pc, vm.rb, vm.steps = pc, rb, steps
+            yield from vm.interpret()
+        else:
+            compile_block(mem, pc)
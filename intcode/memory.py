@@ -0,0 +1,198 @@
+from __future__ import annotations
+import struct
+from array import array
+from typing import (Callable, Dict, Iterator, List, MutableSequence, Optional,
+                    Sequence, Tuple)
+
+from intcode.ops import ARITY, IMM, POS, REL, Op
+
+# Memory is mapped in pages of PAGE_SIZE cells, 4 KiB of int64s. The page
+# holding an address is address >> PAGE_BITS, and the cell within it is
+# address & PAGE_MASK.
+PAGE_BITS = 9
+PAGE_SIZE = 1 << PAGE_BITS
+PAGE_MASK = PAGE_SIZE - 1
+
+# A page is an array('q'), until a value that doesn't fit in an int64 is
+# written to it. Then it's promoted to a list of Python ints, for good.
+Page = MutableSequence[int]
+
+PACK_PAGE = struct.Struct(f"{PAGE_SIZE}q")
+
+# Unmapped pages read as this page. It's never written.
+ZERO_PAGE = array("q", bytes(8 * PAGE_SIZE))
+
+# A decoded instruction: (op, next pc, a, ar, b, br, c, cr). The address of
+# operand a is a + ar * rb, where ar is 1 for a relative parameter and 0
+# otherwise. Immediate parameters resolve to their own cell, so every operand
+# is read the same way. Unused operands are 0.
+Insn = Tuple[int, int, int, int, int, int, int, int]
+
+# A compiled basic block. It takes (mem, mem.pages, mem.owned, mem.code, rb,
+# output), runs to the end of the block, and returns (next pc, rb,
+# instructions executed).
+Block = Callable[..., Tuple[int, int, int]]
+
+
+class Memory:
+    """Sparse, paged Intcode memory, plus a cache of the instructions decoded
+    from it.
+
+    A VM costs only the pages it touches, and any address works. Every write
+    through mem[...] drops the decoded instructions it lands on, so
+    self-modifying programs stay correct.
+
+    The interpreter reads .pages and writes .owned directly, and must check
+    .code itself. Both are plain dicts, which index fastest: a missing page
+    raises KeyError, and fault() maps it so the access can be retried. A
+    value too big for its page raises OverflowError, and promote() makes
+    room for it so the write can be retried.
+    """
+
+    def __init__(self, program: Sequence[int]) -> None:
+        # Readable pages by number. Pages only ever read map ZERO_PAGE.
+        self.pages: Dict[int, Page] = {}
+        # Writable pages by number.
+        self.owned: Dict[int, Page] = {}
+        for start in range(0, len(program), PAGE_SIZE):
+            cells = list(program[start:start + PAGE_SIZE])
+            cells += ZERO_PAGE[len(cells):]
+            page: Page
+            try:
+                # Packing is quicker than building an array cell by cell.
+                page = array("q", PACK_PAGE.pack(*cells))
+            except struct.error:
+                page = cells
+            self.pages[start >> PAGE_BITS] = page
+            self.owned[start >> PAGE_BITS] = page
+        self.decoded: Dict[int, Insn] = {}
+        # Compiled basic blocks, as (block, end), keyed by their first pc.
+        self.blocks: Dict[int, Tuple[Block, int]] = {}
+        # Whether any block was overwritten after compiling.
+        self.unstable = False
+        # How many decoded instructions and blocks cover each address.
+        self.code: Dict[int, int] = {}
+
+    def __getitem__(self, location: int) -> int:
+        page = self.pages.get(location >> PAGE_BITS, ZERO_PAGE)
+        return page[location & PAGE_MASK]
+
+    def __setitem__(self, location: int, value: int) -> None:
+        key = location >> PAGE_BITS
+        while key not in self.owned:
+            self.fault(key)
+        try:
+            self.owned[key][location & PAGE_MASK] = value
+        except OverflowError:
+            self.promote(location)
+            self.owned[key][location & PAGE_MASK] = value
+        if location in self.code:
+            self.invalidate(location)
+
+    def fault(self, key: int) -> None:
+        """Map page key, after an access to it raised KeyError.
+
+        A page that isn't readable maps ZERO_PAGE for reading, costing
+        nothing. A page that's readable but not writable, because it's zero
+        or shared with a fork, gets its own copy. Since reads fault first, a
+        write may fault twice.
+        """
+        if key not in self.pages:
+            self.pages[key] = ZERO_PAGE
+        else:
+            self.pages[key] = self.owned[key] = self.pages[key][:]
+
+    def promote(self, location: int) -> None:
+        """Make the page holding location, which must be writable, hold any
+        int, after writing one raised OverflowError."""
+        key = location >> PAGE_BITS
+        self.pages[key] = self.owned[key] = list(self.owned[key])
+
+    def fork(self) -> Memory:
+        """Copy this memory cheaply. The copies share pages until either
+        writes to one, which faults it and makes a private copy."""
+        child = Memory([])
+        child.pages.update(self.pages)
+        # Clear in place, since running generators hold this dict.
+        self.owned.clear()
+        child.decoded.update(self.decoded)
+        child.blocks.update(self.blocks)
+        child.unstable = self.unstable
+        child.code.update(self.code)
+        return child
+
+    def decode(self, pc: int) -> Insn:
+        """Decode the instruction at pc, and cache it."""
+        insn = decode(self, pc)
+        self.decoded[pc] = insn
+        self.cover(pc, insn[1])
+        return insn
+
+    def invalidate(self, location: int) -> None:
+        """Drop every decoded instruction and block covering location."""
+        for pc in range(location - 3, location + 1):
+            insn = self.decoded.get(pc)
+            if insn is not None and location < insn[1]:
+                del self.decoded[pc]
+                self.uncover(pc, insn[1])
+        # Blocks are few, and overwriting one is rare.
+        for pc, (_, end) in list(self.blocks.items()):
+            if pc <= location < end:
+                del self.blocks[pc]
+                self.unstable = True
+                self.uncover(pc, end)
+
+    def cover(self, start: int, end: int) -> None:
+        for location in range(start, end):
+            self.code[location] = self.code.get(location, 0) + 1
+
+    def uncover(self, start: int, end: int) -> None:
+        for location in range(start, end):
+            self.code[location] -= 1
+            if not self.code[location]:
+                del self.code[location]
+
+    def dump(self, size: Optional[int] = None) -> List[int]:
+        """Copy out the first size cells, or if None, every cell up to the
+        end of the last page holding data. Pages only ever read map
+        ZERO_PAGE, so far reads don't make this any bigger."""
+        if size is None:
+            held = [k for k, p in self.pages.items() if p is not ZERO_PAGE]
+            size = (max(held, default=-1) + 1) << PAGE_BITS
+        cells: List[int] = []
+        for key in range((size + PAGE_MASK) >> PAGE_BITS):
+            cells += self.pages.get(key, ZERO_PAGE)
+        return cells[:size]
+
+    def views(self) -> Iterator[Tuple[int, Sequence[int]]]:
+        """Yield (address, cells) for every mapped page, in order, without
+        copying. The cells are read-only, but live: they change with the
+        memory, until a fault or promotion replaces the page. Promoted pages
+        are lists, so they're copied to tuples."""
+        for key in sorted(self.pages):
+            page = self.pages[key]
+            if isinstance(page, array):
+                yield key << PAGE_BITS, memoryview(page).toreadonly()
+            else:
+                yield key << PAGE_BITS, tuple(page)
+
+
+def decode(mem: Memory, pc: int) -> Insn:
+    """Decode the instruction at pc."""
+    ins = mem[pc]
+    try:
+        op = Op(ins % 100)
+    except ValueError:
+        raise RuntimeError(f"encountered invalid opcode {ins % 100}") from None
+    operands = [0] * 6
+    for i in range(ARITY[op]):
+        mode = ins // pow(10, 2 + i) % 10
+        if mode not in (POS, IMM, REL):
+            raise RuntimeError(f"encountered invalid mode {mode}")
+        if mode == IMM:
+            operands[2 * i] = pc + 1 + i
+        else:
+            operands[2 * i] = mem[pc + 1 + i]
+            operands[2 * i + 1] = int(mode == REL)
+    a, ar, b, br, c, cr = operands
+    return (int(op), pc + 1 + ARITY[op], a, ar, b, br, c, cr)
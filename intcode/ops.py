@@ -0,0 +1,49 @@
+import enum
+
+
+class Op(enum.IntEnum):
+    ADD = 1  # add
+    MUL = 2  # multiply
+    SAV = 3  # save
+    OUT = 4  # output
+    JIT = 5  # jump if true
+    JIF = 6  # jump if false
+    LTH = 7  # less than
+    EQL = 8  # equals
+    IRB = 9  # increment relative base
+    HLT = 99  # halt
+
+
+ARITY = {
+    Op.ADD: 3,
+    Op.MUL: 3,
+    Op.SAV: 1,
+    Op.OUT: 1,
+    Op.JIT: 2,
+    Op.JIF: 2,
+    Op.LTH: 3,
+    Op.EQL: 3,
+    Op.IRB: 1,
+    Op.HLT: 0,
+}
+
+
+class Mode(enum.IntEnum):
+    POS = 0
+    IMM = 1
+    REL = 2
+
+
+class State(enum.IntEnum):
+    BLOCKED = 0
+    HALTED = 1
+    PREEMPTED = 2  # Used up its quantum, see VirtualMachine.quantum.
+
+
+# An instruction count standing in for no quantum, which is never reached.
+UNLIMITED = 1 << 63
+
+# Plain ints for the interpreter loop, which compares them once per
+# instruction and can't afford the enum machinery.
+ADD, MUL, SAV, OUT, JIT, JIF, LTH, EQL, IRB, HLT = map(int, Op)
+POS, IMM, REL = map(int, Mode)
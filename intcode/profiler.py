@@ -0,0 +1,124 @@
+"""Profile Intcode programs.
+
+A VM with a Profile set runs in execute() below rather than the interpreter,
+stepping one instruction at a time and recording as it goes. Without one,
+the interpreter runs exactly as before, so profiling costs nothing when
+it's off.
+"""
+from __future__ import annotations
+import json
+import time
+from collections import Counter
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Set, Tuple
+
+from intcode.ops import (ADD, EQL, IRB, JIF, JIT, LTH, MUL, OUT, SAV,
+                         UNLIMITED, Op, State)
+
+if TYPE_CHECKING:
+    from intcode.vm import VirtualMachine
+
+
+class Profile:
+    """Counts from running a VM, accumulated across runs."""
+
+    def __init__(self) -> None:
+        self.ops: Counter[str] = Counter()  # Executions by opcode name.
+        self.pcs: Counter[int] = Counter()  # Executions by pc.
+        self.instructions = 0
+        self.blocked = 0.0  # Seconds spent blocked on input.
+        self.touched: Set[int] = set()  # Every cell read or written.
+        # Taken backward jumps, by (target, end of the jump).
+        self.loops: Counter[Tuple[int, int]] = Counter()
+
+    def hot_loops(self, n: int = 5) -> List[Dict[str, int]]:
+        """Return the n loops that ran the most instructions, as the pc
+        range [start, end) between a backward jump's target and itself."""
+        loops = [{
+            "start": start,
+            "end": end,
+            "iterations": iterations,
+            "instructions": sum(self.pcs[pc] for pc in range(start, end)),
+        } for (start, end), iterations in self.loops.items()]
+        loops.sort(key=lambda loop: loop["instructions"], reverse=True)
+        return loops[:n]
+
+    def dump(self) -> Dict[str, Any]:
+        """Return everything, in a form json can write and compare."""
+        return {
+            "instructions": self.instructions,
+            "blocked_seconds": self.blocked,
+            "cells_touched": len(self.touched),
+            "ops": dict(sorted(self.ops.items())),
+            "pcs": {
+                str(pc): n
+                for pc, n in sorted(self.pcs.items())
+            },
+            "hot_loops": self.hot_loops(),
+        }
+
+    def save(self, path: str) -> None:
+        with open(path, "w") as f:
+            json.dump(self.dump(), f, indent=2)
+
+
+def execute(vm: VirtualMachine, profile: Profile) -> Iterator[State]:
+    """Like VirtualMachine.interpret(), but recording into profile."""
+    mem, inp, out = vm.mem, vm.input, vm.output
+    names = {int(op): op.name for op in Op}
+    pc, rb, steps = vm.pc, vm.rb, vm.steps
+    limit = steps + (vm.quantum or UNLIMITED)
+    while True:
+        op, nxt, a, ar, b, br, c, cr = mem.decoded.get(pc) or mem.decode(pc)
+        a, b, c = a + rb * ar, b + rb * br, c + rb * cr
+        at, jumped = pc, False
+        if op in (ADD, MUL, LTH, EQL):
+            x, y = mem[a], mem[b]
+            if op == ADD:
+                mem[c] = x + y
+            elif op == MUL:
+                mem[c] = x * y
+            elif op == LTH:
+                mem[c] = int(x < y)
+            else:
+                mem[c] = int(x == y)
+            profile.touched.update((a, b, c))
+            pc = nxt
+        elif op in (JIT, JIF):
+            profile.touched.update((a, b))
+            if bool(mem[a]) == (op == JIT):
+                jumped, pc = True, mem[b]
+            else:
+                pc = nxt
+        elif op == IRB:
+            profile.touched.add(a)
+            rb += mem[a]
+            pc = nxt
+        elif op == OUT:
+            profile.touched.add(a)
+            out.put(mem[a])
+            pc = nxt
+        elif op == SAV:
+            if not inp:
+                vm.pc, vm.rb, vm.steps = pc, rb, steps
+                start = time.perf_counter()
+                while not inp:
+                    yield State.BLOCKED
+                profile.blocked += time.perf_counter() - start
+            profile.touched.add(a)
+            mem[a] = inp.get()
+            pc = nxt
+        else:  # HLT, since decoding rejects invalid opcodes.
+            vm.pc, vm.rb, vm.steps = pc, rb, steps
+            while True:
+                yield State.HALTED
+        steps += 1
+        profile.instructions += 1
+        profile.ops[names[op]] += 1
+        profile.pcs[at] += 1
+        profile.touched.update(range(at, nxt))
+        if jumped and pc <= at:
+            profile.loops[pc, nxt] += 1
+        if op in (JIT, JIF) and steps >= limit:
+            vm.pc, vm.rb, vm.steps = pc, rb, steps
+            yield State.PREEMPTED
+            limit = steps + (vm.quantum or UNLIMITED)
@@ -0,0 +1,67 @@
+from __future__ import annotations
+import heapq
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from intcode.ops import State
+from intcode.vm import VirtualMachine
+
+
+class Scheduler:
+    """Run VMs that talk over channels, resuming only the ones with input.
+
+    A VM is ready when it hasn't run yet, was preempted, or its input has
+    data. Running one may make the VMs reading its output ready, and nothing
+    else, so blocked VMs are never polled. When no VM is ready, every one
+    that hasn't halted is blocked with nothing in flight, which is a
+    deadlock.
+
+    With a quantum, each VM runs at most about that many instructions at a
+    time, and the ready VM that has run the fewest instructions goes next,
+    so a busy VM can't starve the rest.
+    """
+
+    def __init__(self,
+                 vms: List[VirtualMachine],
+                 quantum: Optional[int] = None) -> None:
+        self.vms = vms
+        for vm in vms:
+            vm.quantum = quantum
+        self.executions: Dict[VirtualMachine, Iterator[State]] = {
+            vm: vm.execute()
+            for vm in vms
+        }
+        # Channels are deques, which don't hash, so go by identity.
+        self.readers: Dict[int, List[VirtualMachine]] = {}
+        for vm in vms:
+            self.readers.setdefault(id(vm.input), []).append(vm)
+        # A heap of (steps, index in vms), since VMs don't compare.
+        self.ready: List[Tuple[int, int]] = [(vm.steps, i)
+                                             for i, vm in enumerate(vms)]
+        heapq.heapify(self.ready)
+        self.queued: Set[VirtualMachine] = set(vms)
+        self.halted: Set[VirtualMachine] = set()
+        self.index = {vm: i for i, vm in enumerate(vms)}
+
+    def run(self, until: Optional[VirtualMachine] = None) -> None:
+        """Run until the VM until halts, or every VM if None. Raise
+        RuntimeError on deadlock."""
+        while len(self.halted) < len(self.vms) and until not in self.halted:
+            if not self.ready:
+                blocked = len(self.vms) - len(self.halted)
+                raise RuntimeError(
+                    f"deadlock: {blocked} VMs blocked with no input")
+            vm = self.vms[heapq.heappop(self.ready)[1]]
+            self.queued.remove(vm)
+            state = next(self.executions[vm])
+            if state == State.HALTED:
+                self.halted.add(vm)
+            elif state == State.PREEMPTED:
+                self.push(vm)
+            for reader in self.readers.get(id(vm.output), []) + [vm]:
+                if reader.input and reader not in self.queued and \
+                        reader not in self.halted:
+                    self.push(reader)
+
+    def push(self, vm: VirtualMachine) -> None:
+        heapq.heappush(self.ready, (vm.steps, self.index[vm]))
+        self.queued.add(vm)
@@ -0,0 +1,221 @@
+from __future__ import annotations
+from typing import Iterator, List, Optional, Sequence, Tuple, Type
+
+from intcode import jit, profiler
+from intcode.channel import Channel
+from intcode.memory import PAGE_BITS, PAGE_MASK, Memory
+from intcode.ops import (ADD, EQL, IRB, JIF, JIT, LTH, MUL, OUT, SAV,
+                         UNLIMITED, State)
+
+
+class VirtualMachine:
+
+    def __init__(self,
+                 jit_blocks: bool = False,
+                 channel: Type[Channel] = Channel) -> None:
+        # Run compiled basic blocks rather than interpreting, see jit.py.
+        self.jit_blocks = jit_blocks
+        # The type of input and output channels. Use ThreadSafeChannel if
+        # VMs talking to this one run on other threads.
+        self.channel = channel
+        self.mem = Memory([])
+        self.pc: int = 0
+        self.rb: int = 0
+        self.steps: int = 0  # Instructions executed so far.
+        # Yield State.PREEMPTED at the first jump after running this many
+        # instructions, if set. Checking only at jumps keeps it cheap, and
+        # every loop has one.
+        self.quantum: Optional[int] = None
+        # Record what runs here, if set, running neither the interpreter nor
+        # compiled blocks. See profiler.py.
+        self.profile: Optional[profiler.Profile] = None
+        self.input = channel()
+        self.output = channel()
+
+    def load(self, program: Sequence[int]) -> None:
+        self.mem = Memory(program)
+        self.pc = 0
+        self.rb = 0
+        self.steps = 0
+
+    def fork(self) -> VirtualMachine:
+        """Clone this VM, with its registers, memory, and queued input and
+        output. Memory is copy-on-write, so forks are cheap."""
+        vm = VirtualMachine(self.jit_blocks, self.channel)
+        vm.mem = self.mem.fork()
+        vm.pc, vm.rb, vm.steps = self.pc, self.rb, self.steps
+        vm.quantum = self.quantum
+        vm.input.push_many(self.input)
+        vm.output.push_many(self.output)
+        return vm
+
+    def rx_from(self, vm: VirtualMachine) -> None:
+        # Must be run *before* manually pushing inputs.
+        self.input = vm.output
+
+    def push_input(self, inp: int) -> None:
+        self.input.put(inp)
+
+    def pop_output(self) -> int:
+        return self.output.get()
+
+    def execute(self) -> Iterator[State]:
+        """Yield State.BLOCKED, State.HALTED, or State.PREEMPTED if there's
+        a quantum."""
+        if self.profile is not None:
+            return profiler.execute(self, self.profile)
+        if self.jit_blocks:
+            return jit.execute(self)
+        return self.interpret()
+
+    def interpret(self) -> Iterator[State]:
+        """Like execute(), but always interpreting.
+
+        The registers live in locals while running, and are written back
+        before every yield, so a fresh generator resumes where the last one
+        stopped. A blocked SAV is retried from the start.
+
+        Reads go through mem.pages, and writes through mem.owned. Neither
+        maps pages by itself; see Memory.fault().
+        """
+        mem, inp, out = self.mem, self.input, self.output
+        pages, owned = mem.pages, mem.owned
+        decoded, code = mem.decoded, mem.code
+        bits, mask = PAGE_BITS, PAGE_MASK
+        pc, rb, steps = self.pc, self.rb, self.steps
+        limit = steps + (self.quantum or UNLIMITED)
+        while True:
+            # Hot loops hit the cache, and skip decoding entirely.
+            op, nxt, a, ar, b, br, c, cr = decoded.get(pc) or mem.decode(pc)
+            if ar:
+                a += rb
+            if br:
+                b += rb
+            if cr:
+                c += rb
+            try:
+                if op == ADD:
+                    x = pages[a >> bits][a & mask]
+                    y = pages[b >> bits][b & mask]
+                    owned[c >> bits][c & mask] = x + y
+                    if c in code:
+                        mem.invalidate(c)
+                    pc = nxt
+                elif op == MUL:
+                    x = pages[a >> bits][a & mask]
+                    y = pages[b >> bits][b & mask]
+                    owned[c >> bits][c & mask] = x * y
+                    if c in code:
+                        mem.invalidate(c)
+                    pc = nxt
+                elif op == JIT:
+                    if pages[a >> bits][a & mask]:
+                        pc = pages[b >> bits][b & mask]
+                    else:
+                        pc = nxt
+                    if steps >= limit:
+                        self.pc, self.rb, self.steps = pc, rb, steps + 1
+                        yield State.PREEMPTED
+                        limit = steps + (self.quantum or UNLIMITED)
+                elif op == JIF:
+                    if pages[a >> bits][a & mask]:
+                        pc = nxt
+                    else:
+                        pc = pages[b >> bits][b & mask]
+                    if steps >= limit:
+                        self.pc, self.rb, self.steps = pc, rb, steps + 1
+                        yield State.PREEMPTED
+                        limit = steps + (self.quantum or UNLIMITED)
+                elif op == LTH:
+                    x = pages[a >> bits][a & mask]
+                    y = pages[b >> bits][b & mask]
+                    owned[c >> bits][c & mask] = int(x < y)
+                    if c in code:
+                        mem.invalidate(c)
+                    pc = nxt
+                elif op == EQL:
+                    x = pages[a >> bits][a & mask]
+                    y = pages[b >> bits][b & mask]
+                    owned[c >> bits][c & mask] = int(x == y)
+                    if c in code:
+                        mem.invalidate(c)
+                    pc = nxt
+                elif op == IRB:
+                    rb += pages[a >> bits][a & mask]
+                    pc = nxt
+                elif op == OUT:
+                    out.put(pages[a >> bits][a & mask])
+                    pc = nxt
+                elif op == SAV:
+                    if not inp:
+                        self.pc, self.rb, self.steps = pc, rb, steps
+                        while not inp:
+                            yield State.BLOCKED
+                    mem[a] = inp.get()  # Can't be retried, so can't fault.
+                    pc = nxt
+                else:  # HLT, since decoding rejects invalid opcodes.
+                    self.pc, self.rb, self.steps = pc, rb, steps
+                    while True:
+                        yield State.HALTED
+            except KeyError as fault:
+                # Every instruction faults before changing anything, so map
+                # the page and retry.
+                mem.fault(fault.args[0])
+                continue
+            except OverflowError:
+                # Only writes overflow, and they come last, so make room and
+                # retry.
+                mem.promote(c)
+                continue
+            steps += 1
+
+    def exhaust(self) -> None:
+        """Run until halted, waiting on input whenever blocked. With a plain
+        Channel that's an error, since nothing else can push input while
+        we're running, but a ThreadSafeChannel waits for other threads."""
+        for state in self.execute():
+            if state == State.HALTED:
+                break
+            if state == State.PREEMPTED:
+                continue
+            try:
+                self.input.wait()
+            except RuntimeError:
+                raise RuntimeError(
+                    "blocked on input while exhausting") from None
+
+    def drain(self) -> Iterator[int]:
+        while self.output:
+            yield self.output.get()
+
+    def memory_dump(self, size: Optional[int] = None) -> List[int]:
+        return self.mem.dump(size)
+
+    def memory_views(self) -> Iterator[Tuple[int, Sequence[int]]]:
+        """Like memory_dump(), but without copying; see Memory.views()."""
+        return self.mem.views()
+
+
+def warm_start(program: List[int],
+               jit_blocks: bool = False,
+               limit: int = 100000) -> VirtualMachine:
+    """Load program, and run it until it first needs input, or halts.
+
+    Everything up to the first SAV doesn't depend on input, so runs that
+    only differ in input can fork the result rather than redo it. Programs
+    that output first, or run about limit instructions without needing
+    input, might never need any, so they stop there instead, and forks
+    pick up where they left off.
+    """
+    vm = VirtualMachine(jit_blocks)
+    vm.load(program)
+    vm.quantum = min(limit, 10000)
+    for state in vm.execute():
+        if state != State.PREEMPTED or vm.output or vm.steps >= limit:
+            break
+    vm.quantum = None
+    return vm
+
+
+def parse(s: str) -> List[int]:
+    return [int(n) for n in s.split(",")]
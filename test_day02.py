@@ -1,53 +1,222 @@
-import enum
-from typing import List, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 
+import pytest
 
-class Op(enum.IntEnum):
-    ADD = 1
-    MUL = 2
-    HLT = 99
+import intcode
+from intcode import Op
+
+try:
+    import numpy as np
+except ImportError:
+    HAS_NUMPY = False
+else:
+    HAS_NUMPY = True
+
+# A polynomial in noun and verb, as {(i, j): c} for the terms
+# c * noun**i * verb**j. Zero terms are left out.
+Poly = Dict[Tuple[int, int], int]
 
 
 class VirtualMachine:
+    """The day 2 call style, adapted onto the shared Intcode VM."""
+
     # NOTE: The memory size is mutable, and set as large as the loaded program.
     def __init__(self) -> None:
-        self.mem: List[int] = []
+        self.vm = intcode.VirtualMachine()
+        self.size = 0
 
     def load(self, program: List[int]) -> None:
-        self.mem = program[:]  # Deep copy to avoid bugs.
+        self.vm.load(program)
+        self.size = len(program)
 
     def execute(self) -> None:
-        pc = 0
-        while True:
-            op = self.mem[pc]
-            pc += 1
-            if op == Op.ADD:
-                src1, src2, dst = self.mem[pc:pc + 3]
-                pc += 3
-                self.mem[dst] = self.mem[src1] + self.mem[src2]
-            elif op == Op.MUL:
-                src1, src2, dst = self.mem[pc:pc + 3]
-                pc += 3
-                self.mem[dst] = self.mem[src1] * self.mem[src2]
-            elif op == Op.HLT:
-                break
-            else:
-                raise RuntimeError("encountered invalid opcode")
+        self.vm.exhaust()
 
     def read(self, location: int) -> int:
-        return self.mem[location]
+        return self.vm.mem[location]
 
     def write(self, location: int, value: int) -> None:
-        self.mem[location] = value
+        self.vm.mem[location] = value
 
     def dump(self) -> List[int]:
-        return self.mem
+        return self.vm.memory_dump(self.size)
+
+
+class BatchVirtualMachine:
+    """Many day 2 VMs stepped together with NumPy, one per lane.
+
+    Memory is a lanes x cells array, and lanes that agree on their pc step
+    together. Lanes that diverge are stepped in groups by pc. A lane stops,
+    and is marked failed, where its result could differ from the scalar VM's:
+    on an unknown opcode, an address outside the program, or an int64
+    overflow.
+    """
+
+    def __init__(self, program: List[int], lanes: int) -> None:
+        self.mem: Any = np.tile(np.array(program, dtype=np.int64), (lanes, 1))
+        self.pc: Any = np.zeros(lanes, dtype=np.int64)
+        self.running: Any = np.ones(lanes, dtype=bool)
+        self.failed: Any = np.zeros(lanes, dtype=bool)
+
+    def fail(self, lanes: Any) -> None:
+        self.failed[lanes] = True
+        self.running[lanes] = False
+
+    def step(self, pc: int, lanes: Any) -> None:
+        """Step lanes, which are all at pc."""
+        size = self.mem.shape[1]
+        op = self.mem[lanes, pc]
+        self.running[lanes[op == Op.HLT]] = False
+        self.fail(lanes[(op != Op.HLT) & (op != Op.ADD) & (op != Op.MUL)])
+        lanes = lanes[(op == Op.ADD) | (op == Op.MUL)]
+        if pc + 3 >= size:
+            self.fail(lanes)
+            return
+        src1, src2, dst = (self.mem[lanes, pc + i] for i in (1, 2, 3))
+        ok = ((0 <= src1) & (src1 < size) & (0 <= src2) & (src2 < size) &
+              (0 <= dst) & (dst < size))
+        self.fail(lanes[~ok])
+        lanes, src1, src2, dst = lanes[ok], src1[ok], src2[ok], dst[ok]
+        x, y = self.mem[lanes, src1], self.mem[lanes, src2]
+        mul = self.mem[lanes, pc] == Op.MUL
+        # Estimate in floats to catch results that don't fit in an int64.
+        fx, fy = np.abs(x.astype(float)), np.abs(y.astype(float))
+        overflow = np.where(mul, fx * fy, fx + fy) >= 2.0**62
+        self.fail(lanes[overflow])
+        ok = ~overflow
+        self.mem[lanes[ok], dst[ok]] = np.where(mul, x * y, x + y)[ok]
+        self.pc[lanes[ok]] += 4
+
+    def execute(self) -> None:
+        while self.running.any():
+            for pc in np.unique(self.pc[self.running]):
+                self.step(int(pc),
+                          np.flatnonzero(self.running & (self.pc == pc)))
+
+
+def batch_search(program: List[int],
+                 desired_output: int,
+                 max_noun: int = 100,
+                 max_verb: int = 100) -> Tuple[int, int]:
+    """Like the brute-force search, but evaluating the whole grid in one
+    vectorized pass. Failed lanes are rerun on the scalar VM."""
+    nouns, verbs = np.divmod(np.arange((max_noun + 1) * (max_verb + 1)),
+                             max_verb + 1)
+    batch = BatchVirtualMachine(program, len(nouns))
+    batch.mem[:, 1], batch.mem[:, 2] = nouns, verbs
+    batch.execute()
+    found = ~batch.failed & (batch.mem[:, 0] == desired_output)
+    vm = VirtualMachine()
+    # Only lanes before the first match can change the answer.
+    for lane in np.flatnonzero(found | batch.failed):
+        noun, verb = int(nouns[lane]), int(verbs[lane])
+        if found[lane]:
+            return noun, verb
+        vm.load(program)
+        vm.write(1, noun)
+        vm.write(2, verb)
+        vm.execute()
+        if desired_output == vm.read(0):
+            return noun, verb
+    raise RuntimeError("desired output could not be found")
+
+
+def poly_add(p: Poly, q: Poly) -> Poly:
+    r = dict(p)
+    for k, c in q.items():
+        r[k] = r.get(k, 0) + c
+    return {k: c for k, c in r.items() if c}
+
+
+def poly_mul(p: Poly, q: Poly) -> Poly:
+    r: Poly = {}
+    for (i1, j1), c1 in p.items():
+        for (i2, j2), c2 in q.items():
+            k = (i1 + i2, j1 + j2)
+            r[k] = r.get(k, 0) + c1 * c2
+    return {k: c for k, c in r.items() if c}
+
+
+def constant(p: Optional[Poly]) -> Optional[int]:
+    """Return p's value if it doesn't depend on the noun or verb."""
+    if p is None or any(k != (0, 0) for k in p):
+        return None
+    return p.get((0, 0), 0)
+
+
+def symbolic_output(program: List[int]) -> Optional[Poly]:
+    """Run program once, with cells 1 and 2 as the symbols noun and verb, and
+    return cell 0 as a polynomial in them.
+
+    Cells read through a symbolic address are unknown, which is fine as long
+    as they're never used. Return None if an opcode, a written address, or
+    the output isn't known, since then only running each noun and verb works.
+    """
+    mem: List[Optional[Poly]] = [{(0, 0): x} if x else {} for x in program]
+    mem[1], mem[2] = {(1, 0): 1}, {(0, 1): 1}
+    pc = 0
+    while 0 <= pc < len(mem):
+        op = constant(mem[pc])
+        if op == Op.HLT:
+            return mem[0]
+        if op not in (Op.ADD, Op.MUL) or pc + 3 >= len(mem):
+            return None
+        src1, src2, dst = map(constant, mem[pc + 1:pc + 4])
+        if dst is None or not 0 <= dst < len(mem):
+            return None
+        x, y = (mem[src] if src is not None and 0 <= src < len(mem) else None
+                for src in (src1, src2))
+        if x is None or y is None:
+            mem[dst] = None
+        elif op == Op.ADD:
+            mem[dst] = poly_add(x, y)
+        else:
+            mem[dst] = poly_mul(x, y)
+        pc += 4
+    return None
+
+
+def solve(output: Poly, desired_output: int, max_noun: int,
+          max_verb: int) -> Optional[Tuple[int, int]]:
+    """Find the first noun, then verb, for which output is desired_output."""
+    for noun in range(max_noun + 1):
+        # Substitute the noun, leaving {j: c} for the terms c * verb**j.
+        terms: Dict[int, int] = {}
+        for (i, j), c in output.items():
+            terms[j] = terms.get(j, 0) + c * noun**i
+        c0, c1 = terms.pop(0, 0), terms.pop(1, 0)
+        if any(terms.values()):
+            # Not linear in the verb, so just evaluate it.
+            for verb in range(max_verb + 1):
+                value = c0 + c1 * verb + sum(c * verb**j
+                                             for j, c in terms.items())
+                if value == desired_output:
+                    return noun, verb
+        elif c1 == 0:
+            if c0 == desired_output:
+                return noun, 0
+        elif (desired_output - c0) % c1 == 0:
+            verb = (desired_output - c0) // c1
+            if 0 <= verb <= max_verb:
+                return noun, verb
+    return None
 
 
 def find_desired_output(program: List[int],
                         desired_output: int,
                         max_noun: int = 100,
-                        max_verb: int = 100) -> Tuple[int, int]:
+                        max_verb: int = 100,
+                        batch: bool = False) -> Tuple[int, int]:
+    """With batch, search with NumPy if it's installed, else one by one."""
+    output = symbolic_output(program)
+    if output is not None:
+        answer = solve(output, desired_output, max_noun, max_verb)
+        if answer is None:
+            raise RuntimeError("desired output could not be found")
+        return answer
+    if batch and HAS_NUMPY:
+        return batch_search(program, desired_output, max_noun, max_verb)
+
     vm = VirtualMachine()
     for noun in range(max_noun + 1):
         for verb in range(max_verb + 1):
@@ -74,9 +243,56 @@ def test_cases() -> None:
         assert vm.dump() == y
 
 
+def test_symbolic_output() -> None:
+    program = intcode.read_program("input/02.txt")
+
+    output = symbolic_output(program)
+    assert output is not None
+    vm = VirtualMachine()
+    for noun, verb in [(0, 0), (12, 2), (52, 8), (100, 100)]:
+        vm.load(program)
+        vm.write(1, noun)
+        vm.write(2, verb)
+        vm.execute()
+        want = vm.read(0)
+        got = sum(c * noun**i * verb**j for (i, j), c in output.items())
+        assert want == got
+
+
+def test_symbolic_fallback() -> None:
+    """Is an output that reads through the noun and verb brute-forced?"""
+    program = [1, 0, 0, 0, 99, 7, 30]
+    assert symbolic_output(program) is None
+    assert find_desired_output(program, 60, 6, 6) == (6, 6)
+
+
+def test_symbolic_halt_at_end() -> None:
+    """Is a halt in the last three cells still reached symbolically?"""
+    program = [1, 0, 0, 3, 1, 9, 10, 0, 99, 3, 4]
+    assert symbolic_output(program) == {(0, 0): 7}
+
+
+def test_batch_fallback(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Does a batch search without NumPy fall back to one by one?"""
+    monkeypatch.setitem(globals(), "HAS_NUMPY", False)
+    program = [1, 0, 0, 0, 99, 7, 30]
+    assert find_desired_output(program, 60, 6, 6, batch=True) == (6, 6)
+
+
+@pytest.mark.skipif(not HAS_NUMPY, reason="needs NumPy")
+def test_batch_search() -> None:
+    program = intcode.read_program("input/02.txt")
+
+    assert batch_search(program, 19690720) == (52, 8)
+    program = [1, 0, 0, 0, 99, 7, 30]
+    assert find_desired_output(program, 60, 6, 6, batch=True) == (6, 6)
+    # Overflowing int64s, so rerun on the scalar VM.
+    program = [1, 0, 0, 0, 2, 9, 9, 0, 99, 2**40]
+    assert batch_search(program, 2**80, 10, 0) == (0, 0)
+
+
 def test_solution_part_1() -> None:
-    with open("input/02.txt") as f:
-        program = [int(n) for n in f.read().split(",")]
+    program = intcode.read_program("input/02.txt")
 
     vm = VirtualMachine()
     vm.load(program)
@@ -87,8 +303,7 @@ def test_solution_part_1() -> None:
 
 
 def test_solution_part_2() -> None:
-    with open("input/02.txt") as f:
-        program = [int(n) for n in f.read().split(",")]
+    program = intcode.read_program("input/02.txt")
 
     noun, verb = find_desired_output(program, 19690720)
     assert 100 * noun + verb == 5208
@@ -1,4 +1,7 @@
-from typing import Iterator
+import random
+from bisect import bisect_left, bisect_right, insort
+from collections import defaultdict
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
 
 DIRECTIONS = {
     "R": 1,
@@ -21,23 +24,176 @@ def walk(wire: str) -> Iterator[complex]:
             yield head
 
 
-def part_1(w1: str, w2: str) -> int:
-    p1, p2 = set(walk(w1)), set(walk(w2))
+class Segment(NamedTuple):
+    """A straight part of a wire, covering the points lo to hi along a line,
+    excluding where it starts."""
 
-    def heuristic(p: complex) -> int:
-        return int(abs(p.real) + abs(p.imag))
+    horizontal: bool
+    line: int  # y if horizontal, otherwise x.
+    lo: int
+    hi: int
+    start: int  # Where it starts along the line.
+    steps: int  # Steps taken before it starts.
 
-    return min(map(heuristic, p1.intersection(p2)))
+    def steps_to(self, along: int) -> int:
+        return self.steps + abs(along - self.start)
 
 
-def part_2(w1: str, w2: str) -> int:
-    p1, p2 = list(walk(w1)), list(walk(w2))
+# A point where two wires cross, as (x, y, steps along one, steps along the
+# other).
+Crossing = Tuple[int, int, int, int]
+
+
+def segments(wire: str) -> List[Segment]:
+    x, y, steps = 0, 0, 0
+    result = []
+    for token in wire.split(","):
+        direction, distance = DIRECTIONS[token[0]], int(token[1:])
+        dx, dy = int(direction.real), int(direction.imag)
+        if distance:
+            start = x if dx else y
+            lo, hi = sorted((start + dx + dy, start + distance * (dx + dy)))
+            line = y if dx else x
+            result.append(Segment(bool(dx), line, lo, hi, start, steps))
+        x, y, steps = x + distance * dx, y + distance * dy, steps + distance
+    return result
+
+
+def perpendicular(hs: List[Segment], vs: List[Segment]) -> Iterator[Crossing]:
+    """Yield where horizontal segments in hs cross vertical ones in vs,
+    sweeping across x. The steps are along h, then along v."""
+    events = [(h.lo, 0, h) for h in hs if h.horizontal]
+    events += [(v.line, 1, v) for v in vs if not v.horizontal]
+    events += [(h.hi, 2, h) for h in hs if h.horizontal]
+    # At each x, add horizontal segments, then find crossings, then remove.
+    events.sort(key=lambda event: event[:2])
+    lines: List[int] = []  # Every y with active horizontal segments, sorted.
+    active: Dict[int, List[Segment]] = defaultdict(list)
+    for x, kind, segment in events:
+        if kind == 0:
+            if not active[segment.line]:
+                insort(lines, segment.line)
+            active[segment.line].append(segment)
+        elif kind == 2:
+            active[segment.line].remove(segment)
+            if not active[segment.line]:
+                lines.pop(bisect_left(lines, segment.line))
+        else:
+            i = bisect_left(lines, segment.lo)
+            j = bisect_right(lines, segment.hi)
+            for y in lines[i:j]:
+                for h in active[y]:
+                    yield x, y, h.steps_to(x), segment.steps_to(y)
+
+
+def collinear(s1: List[Segment], s2: List[Segment]) -> Iterator[Crossing]:
+    """Yield every point where segments in s1 and s2 overlap along the same
+    line."""
+    lines = defaultdict(list)
+    for b in s2:
+        lines[b.horizontal, b.line].append(b)
+    for a in s1:
+        for b in lines[a.horizontal, a.line]:
+            for along in range(max(a.lo, b.lo), min(a.hi, b.hi) + 1):
+                x, y = (along, a.line) if a.horizontal else (a.line, along)
+                yield x, y, a.steps_to(along), b.steps_to(along)
 
-    def heuristic(p: complex) -> int:
-        # Add 2, since .index() starts at 0.
-        return p1.index(p) + p2.index(p) + 2
 
-    return min(map(heuristic, set(p1).intersection(p2)))
+def crossings(w1: str, w2: str) -> Iterator[Crossing]:
+    """Yield every point where w1 and w2 cross, with the steps along each,
+    as often as they cross there. It costs time in the number of segments
+    and crossings, not in the wires' lengths."""
+    s1, s2 = segments(w1), segments(w2)
+    yield from perpendicular(s1, s2)
+    for x, y, steps2, steps1 in perpendicular(s2, s1):
+        yield x, y, steps1, steps2
+    yield from collinear(s1, s2)
+
+
+# A line cut into stretches: where each starts, in order, and the first
+# segment walked over it, or None.
+Stretches = Tuple[List[int], List[Optional[Segment]]]
+
+
+def stretches(walked: List[Segment]) -> Stretches:
+    """Cut the line under walked, segments on one line in the order walked,
+    at their ends, and find the first segment over each stretch."""
+    cuts = sorted({s.lo for s in walked} | {s.hi + 1 for s in walked})
+    owners: List[Optional[Segment]] = [None] * len(cuts)
+    # The first stretch from each that might have no owner yet, so each
+    # stretch is only visited once it's owned.
+    unowned = list(range(len(cuts)))
+
+    def find(i: int) -> int:
+        while unowned[i] != i:
+            unowned[i] = unowned[unowned[i]]
+            i = unowned[i]
+        return i
+
+    for segment in walked:
+        end = bisect_left(cuts, segment.hi + 1)
+        i = find(bisect_left(cuts, segment.lo))
+        while i < end:
+            owners[i] = segment
+            unowned[i] = i + 1
+            i = find(i + 1)
+    return cuts, owners
+
+
+class StepIndex:
+    """The steps along a wire to its first visit of any point.
+
+    Each line the wire runs along is cut into stretches at the ends of its
+    segments there, and each stretch keeps the first segment walked over
+    it. A lookup bisects the two lines through the point for its stretch,
+    so costs O(log segments) however often the wire doubles back.
+    """
+
+    def __init__(self, wire: str) -> None:
+        walked: Dict[Tuple[bool, int], List[Segment]] = defaultdict(list)
+        for segment in segments(wire):
+            walked[segment.horizontal, segment.line].append(segment)
+        self.lines = {key: stretches(line) for key, line in walked.items()}
+
+    def first_visit(self, x: int, y: int) -> Optional[int]:
+        """Return the steps to (x, y), or None if the wire never visits."""
+        visits = []
+        for horizontal, line, along in ((True, y, x), (False, x, y)):
+            cuts, owners = self.lines.get((horizontal, line), ([], []))
+            i = bisect_right(cuts, along) - 1
+            segment = owners[i] if i >= 0 else None
+            if segment is not None:
+                visits.append(segment.steps_to(along))
+        return min(visits, default=None)
+
+
+def intersect(*wires: str) -> Dict[Tuple[int, int], Tuple[int, ...]]:
+    """Map every point all of wires visit, two or more, to the steps of each
+    one's first visit there."""
+    first: Dict[Tuple[int, int], Tuple[int, int]] = {}
+    for x, y, steps1, steps2 in crossings(wires[0], wires[1]):
+        old1, old2 = first.get((x, y), (steps1, steps2))
+        first[x, y] = min(old1, steps1), min(old2, steps2)
+    indexes = [StepIndex(wire) for wire in wires[2:]]
+    result = {}
+    for (x, y), steps in first.items():
+        visits = list(steps)
+        for index in indexes:
+            visit = index.first_visit(x, y)
+            if visit is None:
+                break
+            visits.append(visit)
+        else:
+            result[x, y] = tuple(visits)
+    return result
+
+
+def part_1(w1: str, w2: str) -> int:
+    return min(abs(x) + abs(y) for x, y in intersect(w1, w2))
+
+
+def part_2(w1: str, w2: str) -> int:
+    return min(map(sum, intersect(w1, w2).values()))
 
 
 def test_cases_part_1() -> None:
@@ -74,6 +230,56 @@ def test_cases_part_2() -> None:
         assert part_2(x, y) == z
 
 
+def test_crossings() -> None:
+    """Do segments find the same crossings as walking every point?"""
+    rng = random.Random(3)
+    for _ in range(100):
+        w1, w2 = (",".join(f"{rng.choice('RULD')}{rng.randrange(0, 9)}"
+                           for _ in range(rng.randrange(1, 20)))
+                  for _ in range(2))
+        p1, p2 = list(walk(w1)), list(walk(w2))
+        common = set(p1).intersection(p2)
+        if not common:
+            continue
+        assert part_1(w1, w2) == min(
+            int(abs(p.real) + abs(p.imag)) for p in common)
+        assert part_2(w1, w2) == min(
+            p1.index(p) + p2.index(p) + 2 for p in common)
+
+
+def test_intersect() -> None:
+    """Does intersecting three wires find each one's first visits?"""
+    rng = random.Random(19)
+    for _ in range(100):
+        wires = [
+            ",".join(f"{rng.choice('RULD')}{rng.randrange(0, 9)}"
+                     for _ in range(rng.randrange(1, 30))) for _ in range(3)
+        ]
+        walks = [list(walk(wire)) for wire in wires]
+        common = set(walks[0]).intersection(*walks[1:])
+        want = {
+            (int(p.real), int(p.imag)):
+            tuple(points.index(p) + 1 for points in walks)
+            for p in common
+        }
+        assert intersect(*wires) == want
+
+
+def test_step_index() -> None:
+    """Does a wire doubling back over its lines keep its first visits?"""
+    rng = random.Random(3)
+    for _ in range(100):
+        wire = ",".join(f"{rng.choice('RULD')}{rng.randrange(0, 9)}"
+                        for _ in range(rng.randrange(1, 60)))
+        points = list(walk(wire))
+        index = StepIndex(wire)
+        for x in range(-10, 11):
+            for y in range(-10, 11):
+                p = complex(x, y)
+                want = points.index(p) + 1 if p in points else None
+                assert index.first_visit(x, y) == want
+
+
 def test_solutions() -> None:
     with open("input/03.txt") as f:
         w1, w2 = [line.strip() for line in f]
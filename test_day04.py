@@ -1,3 +1,9 @@
+import functools
+import math
+import random
+from typing import Iterator
+
+
 def is_sorted(s: str) -> bool:
     """Is s a sorted string?"""
     return list(s) == sorted(s)
@@ -21,14 +27,84 @@ def check_2(password: str) -> bool:
     return is_sorted(password) and is_pair_in_sorted(password)
 
 
+def count_upto(n: int, pair: bool) -> int:
+    """Count the passwords in [0, n] passing check_2 if pair, otherwise
+    check_1, without looking at each one.
+
+    Digits are chosen left to right, never decreasing, and tracking the
+    length of the current run of equal digits (capped at 3) and whether an
+    earlier run satisfied the check. Counts for each state are cached, so
+    it's fast for any number of digits.
+    """
+
+    def satisfies(run: int) -> bool:
+        return run == 2 if pair else run >= 2
+
+    def count_bounded(bound: str) -> int:
+        """Count the passwords of len(bound) digits, up to bound."""
+
+        @functools.lru_cache(maxsize=None)
+        def go(i: int, prev: int, run: int, ok: bool, tight: bool) -> int:
+            if i == len(bound):
+                return int(ok or satisfies(run))
+            top = int(bound[i]) if tight else 9
+            total = 0
+            for d in range(prev, top + 1):
+                still_tight = tight and d == top
+                if i and d == prev:
+                    total += go(i + 1, d, min(run + 1, 3), ok, still_tight)
+                else:
+                    total += go(i + 1, d, 1, ok or satisfies(run), still_tight)
+            return total
+
+        # Passwords don't start with 0, and "0" fails both checks.
+        return go(0, 1, 0, False, True)
+
+    if n < 0:
+        return 0
+    digits = len(str(n))
+    return sum(count_bounded("9" * k)
+               for k in range(1, digits)) + count_bounded(str(n))
+
+
+def count(lo: int, hi: int, pair: bool = False) -> int:
+    return count_upto(hi, pair) - count_upto(lo - 1, pair)
+
+
+def sorted_from(k: int, low: str = "", first: int = 1) -> Iterator[str]:
+    """Yield the sorted strings of k digits from first to 9, in order,
+    starting from the first that's at least low, if given."""
+    if k == 0:
+        yield ""
+        return
+    start = max(first, int(low[0])) if low else first
+    for d in range(start, 10):
+        # Only a prefix equal to low's still needs its rest bounded.
+        rest = low[1:] if low and d == int(low[0]) else ""
+        for tail in sorted_from(k - 1, rest, d):
+            yield str(d) + tail
+
+
+def passwords(lo: int, hi: int, pair: bool = False) -> Iterator[str]:
+    """Yield the passwords in [lo, hi] passing check_2 if pair, otherwise
+    check_1, in order. Only sorted digit strings from lo to hi are ever
+    built."""
+    check = check_2 if pair else check_1
+    start = str(max(lo, 1))
+    for k in range(len(start), len(str(hi)) + 1):
+        for password in sorted_from(k, start if k == len(start) else ""):
+            if int(password) > hi:
+                return
+            if check(password):
+                yield password
+
+
 def part_1(lo: int, hi: int) -> int:
-    passwords = map(str, range(lo, hi + 1))
-    return sum(check_1(p) for p in passwords)
+    return count(lo, hi)
 
 
 def part_2(lo: int, hi: int) -> int:
-    passwords = map(str, range(lo, hi + 1))
-    return sum(check_2(p) for p in passwords)
+    return count(lo, hi, pair=True)
 
 
 def test_cases_part_1() -> None:
@@ -51,6 +127,33 @@ def test_cases_part_2() -> None:
         assert check_2(x) == y
 
 
+def test_count() -> None:
+    """Does counting agree with checking every password?"""
+    rng = random.Random(4)
+    ranges = [(0, 0), (0, 1000), (5, 12), (95, 1234), (99999, 112233)]
+    ranges += [(lo, lo + rng.randrange(5000))
+               for lo in (rng.randrange(10**rng.randrange(1, 7))
+                          for _ in range(20))]
+    for lo, hi in ranges:
+        for pair, check in ((False, check_1), (True, check_2)):
+            want = [str(p) for p in range(lo, hi + 1) if check(str(p))]
+            assert count(lo, hi, pair) == len(want)
+            assert list(passwords(lo, hi, pair)) == want
+
+
+def test_count_long() -> None:
+    # 12 sorted digits from 1 to 9 always repeat one, so all pass check_1.
+    assert count(10**11, 10**12 - 1) == math.comb(20, 8)
+    lo, hi = 123456789012, 345678901234
+    assert count(lo, hi, True) == sum(1 for _ in passwords(lo, hi, True))
+    assert count(10**15, 10**16 - 1, True) < math.comb(24, 8)
+    # Narrow ranges of long passwords are only walked between the bounds.
+    for lo in (111111111111111, 345678888888880, 888888888888888888):
+        for pair in (False, True):
+            want = count(lo, lo + 900, pair)
+            assert sum(1 for _ in passwords(lo, lo + 900, pair)) == want
+
+
 def test_solutions() -> None:
     lo, hi = 246540, 787419
     assert part_1(lo, hi) == 1063
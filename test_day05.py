@@ -1,99 +1,43 @@
-import enum
-from typing import Iterator, List, Tuple
+from typing import Iterator, List
 
+import intcode
 
-class Op(enum.IntEnum):
-    ADD = 1  # add
-    MUL = 2  # multiply
-    SAV = 3  # save
-    OUT = 4  # output
-    JIT = 5  # jump if true
-    JIF = 6  # jump if false
-    LTH = 7  # less than
-    EQL = 8  # equals
-    HLT = 99  # halt
-
-
-ARITY = {
-    Op.ADD: 3,
-    Op.MUL: 3,
-    Op.SAV: 1,
-    Op.OUT: 1,
-    Op.JIT: 2,
-    Op.JIF: 2,
-    Op.LTH: 3,
-    Op.EQL: 3,
-    Op.HLT: 0,
-}
-
-
-class Mode(enum.IntEnum):
-    POS = 0
-    IMM = 1
+# Instructions run between checks for output.
+QUANTUM = 10000
 
 
 class VirtualMachine:
+    """The day 5 call style, adapted onto the shared Intcode VM."""
+
     # NOTE: The memory size is mutable, and set as large as the loaded program.
     def __init__(self) -> None:
-        self.mem: List[int] = []
-        self.pc: int = 0
-        self.input: int = 0
+        self.vm = intcode.VirtualMachine()
+        self.program: List[int] = []
+        # The program, run up to its first input. Reloading the same program
+        # with another input forks this, rather than starting over.
+        self.warm = intcode.VirtualMachine()
+        self.input = 0
 
     def load(self, program: List[int], program_input: int) -> None:
-        self.mem = program[:]  # Deep copy, avoid bugs.
-        self.pc = 0
+        if program != self.program:
+            self.program = program[:]
+            self.warm = intcode.warm_start(program)
+        self.vm = self.warm.fork()
         self.input = program_input
 
     def execute(self) -> Iterator[int]:
-        while True:
-            op, vals, locs = self.read()
-            if op == Op.ADD:
-                self.mem[locs[2]] = vals[0] + vals[1]
-            elif op == Op.MUL:
-                self.mem[locs[2]] = vals[0] * vals[1]
-            elif op == Op.SAV:
-                self.mem[locs[0]] = self.input
-            elif op == Op.OUT:
-                yield vals[0]
-            elif op == Op.JIT:
-                self.pc = vals[1] if vals[0] else self.pc
-            elif op == Op.JIF:
-                self.pc = vals[1] if not vals[0] else self.pc
-            elif op == Op.LTH:
-                self.mem[locs[2]] = int(vals[0] < vals[1])
-            elif op == Op.EQL:
-                self.mem[locs[2]] = int(vals[0] == vals[1])
-            elif op == Op.HLT:
+        # Every SAV reads the same input. The quantum hands over outputs of
+        # programs that never block or halt, too, so this stays lazy.
+        self.vm.quantum = QUANTUM
+        for state in self.vm.execute():
+            yield from self.vm.drain()
+            if state == intcode.State.HALTED:
                 break
-            else:
-                raise RuntimeError("encountered invalid opcode")
-
-    def read(self) -> Tuple[int, List[int], List[int]]:
-        """Return the opcode, a list of values, and a list of locations."""
-        # Read the current instruction.
-        ins = self.mem[self.pc]
-        self.pc += 1
-        # Determine the opcode.
-        op = ins % 100
-        # Start two lists, for values and locations.
-        vals: List[int] = []
-        locs: List[int] = []
-        # Read each used mode, then save a value and optional location.
-        for i in range(ARITY[Op(op)]):
-            mode = ins // pow(10, 2 + i) % 10
-            if mode == Mode.POS:
-                vals.append(self.mem[self.mem[self.pc]])
-                locs.append(self.mem[self.pc])
-            elif mode == Mode.IMM:
-                vals.append(self.mem[self.pc])
-                locs.append(-1)
-            else:
-                raise RuntimeError("encountered invalid mode")
-            self.pc += 1
-        return op, vals, locs
+            if state == intcode.State.BLOCKED:
+                self.vm.push_input(self.input)
 
     def memory_dump(self) -> List[int]:
-        return self.mem[:]  # Deep copy, avoid bugs.
+        return self.vm.memory_dump(len(self.program))
 
 
 def test_input_is_output() -> None:
@@ -162,9 +106,38 @@ def test_input_comparisons() -> None:
             assert next(vm.execute()) == y
 
 
+def test_input_is_repeated() -> None:
+    """Does every input instruction read the program input?"""
+    program = [3, 0, 3, 1, 4, 1, 99]
+    program_input = 5
+
+    vm = VirtualMachine()
+    vm.load(program, program_input)
+    assert list(vm.execute()) == [program_input]
+
+
+def test_output_is_lazy() -> None:
+    """Are outputs yielded from a program that never halts?"""
+    program = [3, 7, 4, 7, 1105, 1, 2, 0]  # Output the input, forever.
+    program_input = 7
+
+    vm = VirtualMachine()
+    vm.load(program, program_input)
+    assert next(vm.execute()) == program_input
+
+
+def test_output_without_input() -> None:
+    """Does loading a program that never reads input return?"""
+    program = [104, 7, 1105, 1, 2]  # Output 7, then loop forever.
+    program_input = 420  # Unused.
+
+    vm = VirtualMachine()
+    vm.load(program, program_input)
+    assert next(vm.execute()) == 7
+
+
 def test_solution_part_1() -> None:
-    with open("input/05.txt") as f:
-        program = [int(n) for n in f.read().split(",")]
+    program = intcode.read_program("input/05.txt")
     program_input = 1
 
     vm = VirtualMachine()
@@ -175,8 +148,7 @@ def test_solution_part_1() -> None:
 
 
 def test_solution_part_2() -> None:
-    with open("input/05.txt") as f:
-        program = [int(n) for n in f.read().split(",")]
+    program = intcode.read_program("input/05.txt")
     program_input = 5
 
     vm = VirtualMachine()
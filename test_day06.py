@@ -1,9 +1,304 @@
-from typing import List
+import functools
+import importlib
+import importlib.util
+import mmap
+import random
+import struct
+import sys
+from array import array
+from pathlib import Path
+from typing import (Any, Callable, Dict, Iterable, Iterator, List, Optional,
+                    Sequence, Tuple)
 
-import networkx as nx  # type: ignore
+import pytest
+
+# networkx is only for checking the tree, and slow to import, so it's
+# imported by the *_networkx functions, through networkx().
+HAS_NETWORKX = importlib.util.find_spec("networkx") is not None
+
+
+class OrbitTree:
+    """An orbit map as a tree, with each body's parent and depth. Bodies
+    orbiting nothing, like COM, are roots at depth 0."""
+
+    def __init__(self, data: List[List[str]]) -> None:
+        self.parent: Dict[str, str] = {}
+        self.children: Dict[str, List[str]] = {}
+        for center, body in data:
+            self.parent[body] = center
+            self.children.setdefault(center, []).append(body)
+        # One pass down from the roots, so each depth is its parent's plus 1.
+        self.roots = [c for c in self.children if c not in self.parent]
+        self.depth = dict.fromkeys(self.roots, 0)
+        stack = self.roots[:]
+        while stack:
+            center = stack.pop()
+            for body in self.children.get(center, []):
+                self.depth[body] = self.depth[center] + 1
+                stack.append(body)
+
+    def checksum(self) -> int:
+        """The number of direct and indirect orbits."""
+        return sum(self.depth.values())
+
+    def ancestor(self, a: str, b: str) -> str:
+        """Return the lowest common ancestor of a and b."""
+        while self.depth[a] > self.depth[b]:
+            a = self.parent[a]
+        while self.depth[b] > self.depth[a]:
+            b = self.parent[b]
+        while a != b:
+            a, b = self.parent[a], self.parent[b]
+        return a
+
+    def transfers(self, a: str, b: str) -> int:
+        """The orbital transfers to get from orbiting what a orbits to
+        orbiting what b orbits."""
+        a, b = self.parent[a], self.parent[b]
+        c = self.ancestor(a, b)
+        return self.depth[a] + self.depth[b] - 2 * self.depth[c]
+
+
+class TransferIndex:
+    """Answers OrbitTree.transfers() in O(1), after O(n log n) work once.
+
+    An Euler tour lists bodies as a depth-first walk enters and returns to
+    them, so the lowest common ancestor of two bodies is the shallowest one
+    between their first visits. A sparse table holds where the shallowest
+    is in every stretch of the tour of a power of two long, and two of
+    those cover any stretch.
+    """
+
+    def __init__(self, data: List[List[str]]) -> None:
+        self.tree = OrbitTree(data)
+        self.tour: List[str] = []
+        self.first: Dict[str, int] = {}
+        self.root: Dict[str, str] = {}  # The root of each body's tree.
+        for root in self.tree.roots:
+            stack = [(root, iter(self.tree.children.get(root, [])))]
+            self.first[root] = len(self.tour)
+            self.root[root] = root
+            self.tour.append(root)
+            while stack:
+                _, bodies = stack[-1]
+                body = next(bodies, None)
+                if body is None:
+                    stack.pop()
+                    if stack:
+                        self.tour.append(stack[-1][0])
+                    continue
+                self.first[body] = len(self.tour)
+                self.root[body] = root
+                self.tour.append(body)
+                stack.append((body, iter(self.tree.children.get(body, []))))
+        self.depths = array("i", (self.tree.depth[b] for b in self.tour))
+        self.table = [array("i", range(len(self.tour)))]
+        span = 1
+        while 2 * span <= len(self.tour):
+            row, depths = self.table[-1], self.depths
+            self.table.append(
+                array("i", (row[i] if depths[row[i]] <= depths[row[i + span]]
+                            else row[i + span]
+                            for i in range(len(self.tour) - 2 * span + 1))))
+            span *= 2
+
+    def shallowest(self, i: int, j: int) -> int:
+        """Return where the shallowest body in tour[i:j + 1] is."""
+        k = (j - i + 1).bit_length() - 1
+        x, y = self.table[k][i], self.table[k][j - (1 << k) + 1]
+        return x if self.depths[x] <= self.depths[y] else y
+
+    def ancestor(self, a: str, b: str) -> str:
+        """Like OrbitTree.ancestor(), raising KeyError for bodies in
+        different trees."""
+        if self.root[a] != self.root[b]:
+            raise KeyError(f"{a} and {b} aren't in the same tree")
+        i, j = sorted((self.first[a], self.first[b]))
+        return self.tour[self.shallowest(i, j)]
+
+    def transfers(self, a: str, b: str) -> int:
+        return self.transfers_many([(a, b)])[0]
+
+    def transfers_many(self, pairs: Iterable[Tuple[str, str]]) -> List[int]:
+        """Answer transfers(a, b) for every (a, b) in pairs, in order."""
+        parent, depth, first = self.tree.parent, self.tree.depth, self.first
+        table, depths = self.table, self.depths
+        result = []
+        for a, b in pairs:
+            a, b = parent[a], parent[b]
+            if self.root[a] != self.root[b]:
+                raise KeyError(f"{a} and {b} aren't in the same tree")
+            i, j = first[a], first[b]
+            if i > j:
+                i, j = j, i
+            k = (j - i + 1).bit_length() - 1
+            x, y = table[k][i], table[k][j - (1 << k) + 1]
+            result.append(depth[a] + depth[b] - 2 * min(depths[x], depths[y]))
+        return result
+
+
+class OrbitMap:
+    """An orbit map interned to integer IDs, as flat arrays.
+
+    IDs are in topological order, so every body's parent has a lower ID and
+    depths take one pass. Roots have parent -1. A saved map is a header,
+    the parents and depths as int32s, then the names separated by newlines.
+    Loading one maps the file and views the arrays in place, and only reads
+    the names when one is first looked up, until close(). Maps are context
+    managers, closing on exit.
+    """
+
+    MAGIC = b"ORBT"
+    HEADER = struct.Struct("<4sQQ")  # Magic, bodies, bytes of names.
+
+    def __init__(self, parents: Sequence[int], depths: Sequence[int],
+                 names: Callable[[], List[str]]) -> None:
+        self.parents = parents
+        self.depths = depths
+        self.read_names = names
+        self.file: Optional[mmap.mmap] = None
+        self.views: List[memoryview] = []  # Into file, released on close.
+
+    @classmethod
+    def from_data(cls, data: List[List[str]]) -> "OrbitMap":
+        tree = OrbitTree(data)
+        names = tree.roots[:]
+        for name in names:  # Grows as it goes, breadth first.
+            names += tree.children.get(name, [])
+        ids = {name: i for i, name in enumerate(names)}
+        parents = array("i", (ids.get(tree.parent.get(name, ""), -1)
+                              for name in names))
+        depths = array("i", (tree.depth[name] for name in names))
+        return cls(parents, depths, lambda: names)
+
+    @functools.cached_property
+    def names(self) -> List[str]:
+        return self.read_names()
+
+    @functools.cached_property
+    def ids(self) -> Dict[str, int]:
+        return {name: i for i, name in enumerate(self.names)}
+
+    def save(self, path: str) -> None:
+        names = "\n".join(self.names).encode()
+        with open(path, "wb") as f:
+            n = len(self.parents)
+            f.write(self.HEADER.pack(self.MAGIC, n, len(names)))
+            for values in (self.parents, self.depths):
+                f.write(array("i", values).tobytes())
+            f.write(names)
+
+    @classmethod
+    def load(cls, path: str) -> "OrbitMap":
+        if sys.byteorder != "little":
+            raise RuntimeError("orbit maps are little-endian")
+        with open(path, "rb") as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, n, size = cls.HEADER.unpack_from(data)
+        if magic != cls.MAGIC:
+            raise RuntimeError("not an orbit map")
+        view = memoryview(data)
+        start = cls.HEADER.size
+        parents = view[start:start + 4 * n].cast("i")
+        depths = view[start + 4 * n:start + 8 * n].cast("i")
+        names = view[start + 8 * n:start + 8 * n + size]
+        orbits = cls(parents, depths, lambda: str(names, "utf-8").split("\n"))
+        orbits.file = data
+        orbits.views = [parents, depths, names, view]
+        return orbits
+
+    def close(self) -> None:
+        """Unmap the file a loaded map views. It can't be used after."""
+        for view in self.views:
+            view.release()
+        self.views = []
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def __enter__(self) -> "OrbitMap":
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+    def checksum(self) -> int:
+        return sum(self.depths)
+
+    def transfers(self, a: str, b: str) -> int:
+        """Like OrbitTree.transfers(), by walking up the parent array."""
+        parents, depths = self.parents, self.depths
+        i, j = parents[self.ids[a]], parents[self.ids[b]]
+        steps = 0
+        while i != j:
+            if i < 0 or j < 0:  # Walked off a root, so in different trees.
+                raise KeyError(f"{a} and {b} aren't in the same tree")
+            if depths[i] < depths[j]:
+                i, j = j, i
+            i = parents[i]
+            steps += 1
+        return steps
+
+
+class OrbitStream:
+    """An orbit map that changes an orbit at a time, keeping its checksum.
+
+    The checksum is the sum, over every orbit, of the size of the subtree
+    that orbits with the body, so each body keeps its subtree size. Adding
+    or removing an orbit changes the sizes up the center's ancestors only,
+    and the checksum by the body's subtree times the center's depth plus
+    one, so it costs O(depth) however big the map is.
+    """
+
+    def __init__(self) -> None:
+        self.parent: Dict[str, str] = {}
+        self.size: Dict[str, int] = {}  # Bodies in each subtree, if not 1.
+        self.checksum = 0
+
+    def ancestors(self, body: str) -> Iterator[str]:
+        while body in self.parent:
+            body = self.parent[body]
+            yield body
+
+    def add(self, center: str, body: str) -> None:
+        """Record that body orbits center."""
+        if body in self.parent:
+            raise RuntimeError(f"{body} already orbits {self.parent[body]}")
+        path = [center, *self.ancestors(center)]
+        if body in path:
+            raise RuntimeError(f"{center} already orbits {body}")
+        size = self.size.get(body, 1)
+        for ancestor in path:
+            self.size[ancestor] = self.size.get(ancestor, 1) + size
+        self.parent[body] = center
+        self.checksum += size * len(path)
+
+    def remove(self, center: str, body: str) -> None:
+        """Record that body no longer orbits center."""
+        if self.parent.get(body) != center:
+            raise RuntimeError(f"{body} doesn't orbit {center}")
+        del self.parent[body]
+        path = [center, *self.ancestors(center)]
+        size = self.size.get(body, 1)
+        for ancestor in path:
+            self.size[ancestor] -= size
+        self.checksum -= size * len(path)
 
 
 def part_1(data: List[List[str]]) -> int:
+    return OrbitTree(data).checksum()
+
+
+def part_2(data: List[List[str]]) -> int:
+    return OrbitTree(data).transfers("YOU", "SAN")
+
+
+def networkx() -> Any:
+    return importlib.import_module("networkx")
+
+
+def part_1_networkx(data: List[List[str]]) -> int:
+    nx = networkx()
     g = nx.Graph()
     g.add_edges_from(data)
     # The shortest path is the number of direct orbits (1, or 0 for COM), plus
@@ -11,7 +306,8 @@ def part_1(data: List[List[str]]) -> int:
     return sum(nx.shortest_path_length(g, n, "COM") for n in g.nodes)
 
 
-def part_2(data: List[List[str]]) -> int:
+def part_2_networkx(data: List[List[str]]) -> int:
+    nx = networkx()
     g = nx.Graph()
     g.add_edges_from(data)
     # Subtract 2, since Santa and I both "start" at the objects we're
@@ -36,6 +332,82 @@ def test_case_part_2() -> None:
     assert part_2(parse(x)) == y
 
 
+def test_transfer_index() -> None:
+    with open("input/06.txt") as f:
+        data = parse(f.read())
+
+    tree, index = OrbitTree(data), TransferIndex(data)
+    rng = random.Random(22)
+    bodies = sorted(tree.parent)
+    pairs = [(rng.choice(bodies), rng.choice(bodies)) for _ in range(1000)]
+    want = [tree.transfers(a, b) for a, b in pairs]
+    assert [index.transfers(a, b) for a, b in pairs] == want
+    assert index.transfers_many(pairs) == want
+    for a, b in pairs[:100]:
+        assert index.ancestor(a, b) == tree.ancestor(a, b)
+
+    # Bodies in different trees have no common ancestor.
+    index = TransferIndex(parse("A)B\nB)YOU\nC)D\nD)SAN"))
+    with pytest.raises(KeyError):
+        index.transfers("YOU", "SAN")
+    with pytest.raises(KeyError):
+        index.ancestor("YOU", "SAN")
+
+
+def test_orbit_map(tmp_path: Path) -> None:
+    with open("input/06.txt") as f:
+        data = parse(f.read())
+
+    path = str(tmp_path / "orbits")
+    OrbitMap.from_data(data).save(path)
+    with OrbitMap.load(path) as orbits:
+        assert orbits.checksum() == 162439
+        assert orbits.transfers("YOU", "SAN") == 367
+        parent = orbits.parents[orbits.ids["YOU"]]
+        assert orbits.names[parent] == OrbitTree(data).parent["YOU"]
+    assert orbits.file is None
+
+    orbits = OrbitMap.from_data(parse("A)B\nB)YOU\nC)D\nD)SAN"))
+    with pytest.raises(KeyError):
+        orbits.transfers("YOU", "SAN")
+    with pytest.raises(KeyError):
+        orbits.transfers("B", "D")  # Both orbit roots.
+
+
+def test_orbit_stream() -> None:
+    """Does the checksum stay right as orbits come and go?"""
+    rng = random.Random(24)
+    data = [[f"B{rng.randrange(i)}", f"B{i}"] for i in range(1, 300)]
+    stream = OrbitStream()
+    for center, body in rng.sample(data, len(data)):
+        stream.add(center, body)
+    assert stream.checksum == OrbitTree(data).checksum()
+    for _ in range(300):
+        # Move a body to orbit something else, unless that makes a cycle.
+        i = rng.randrange(len(data))
+        center, body = data[i]
+        stream.remove(center, body)
+        try:
+            data[i] = [f"B{rng.randrange(300)}", body]
+            stream.add(*data[i])
+        except RuntimeError:
+            data[i] = [center, body]
+            stream.add(center, body)
+        assert stream.checksum == OrbitTree(data).checksum()
+    with pytest.raises(RuntimeError):
+        stream.add("B0", data[0][1])
+
+
+@pytest.mark.skipif(not HAS_NETWORKX, reason="needs networkx")
+def test_networkx() -> None:
+    """Does the tree agree with networkx's shortest paths?"""
+    with open("input/06.txt") as f:
+        data = parse(f.read())
+
+    assert part_1(data) == part_1_networkx(data)
+    assert part_2(data) == part_2_networkx(data)
+
+
 def test_solutions() -> None:
     with open("input/06.txt") as f:
         data = parse(f.read())
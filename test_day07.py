@@ -1,175 +1,163 @@
-from __future__ import annotations
-import enum
+import hashlib
 import itertools
-from typing import Iterator, List, Tuple
-from queue import Queue
+import multiprocessing
+import os
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
 
+import pytest
 
-class Op(enum.IntEnum):
-    ADD = 1  # add
-    MUL = 2  # multiply
-    SAV = 3  # save
-    OUT = 4  # output
-    JIT = 5  # jump if true
-    JIF = 6  # jump if false
-    LTH = 7  # less than
-    EQL = 8  # equals
-    HLT = 99  # halt
+from intcode import (Scheduler, VirtualMachine, parse, read_program,
+                     warm_start)
 
+# The signal from running amplifiers forked from a warm VM, one per phase.
+Signal = Callable[[VirtualMachine, Sequence[int]], int]
 
-ARITY = {
-    Op.ADD: 3,
-    Op.MUL: 3,
-    Op.SAV: 1,
-    Op.OUT: 1,
-    Op.JIT: 2,
-    Op.JIF: 2,
-    Op.LTH: 3,
-    Op.EQL: 3,
-    Op.HLT: 0,
-}
-
-
-class Mode(enum.IntEnum):
-    POS = 0
-    IMM = 1
-
-
-class State(enum.IntEnum):
-    BLOCKED = 0
-    HALTED = 1
 
+def simulate(vms: List[VirtualMachine]) -> List[VirtualMachine]:
+    Scheduler(vms).run(until=vms[-1])
+    return vms
+
+
+def chain_signal(warm: VirtualMachine,
+                 phases: Sequence[int],
+                 signal: int = 0) -> int:
+    """Run an amplifier per phase in series, forking each from warm, and
+    return the last one's signal."""
+    for phase in phases:
+        vm = warm.fork()
+        vm.push_input(phase)
+        vm.push_input(signal)
+        _ = next(vm.execute())
+        signal = vm.pop_output()
+    return signal
+
+
+def feedback_signal(warm: VirtualMachine, phases: Sequence[int]) -> int:
+    """Like chain_signal(), but with the last amplifier feeding the first,
+    until the last one halts."""
+    # Fork enough VMs, each with the program loaded and warmed up.
+    vms = [warm.fork() for _ in range(len(phases))]
+    # Set each VM to recieve input from the VM immediately before it.
+    for i, vm in enumerate(vms):
+        vm.rx_from(vms[(i - 1) % len(vms)])  # -1 % 5 == 4
+    # Push each phase input to its respective VM input queue.
+    for i, phase in enumerate(phases):
+        vms[i].push_input(phase)
+    # Push the initial 0 signal to the first VM.
+    vms[0].push_input(0)
+    # Execute all VMs.
+    vms = simulate(vms)
+    # Get the output from the last VM.
+    return vms[-1].pop_output()
+
+
+class StageCache:
+    """Amplifier outputs, keyed by (program digest, phase, input signal),
+    which is all an amplifier's output depends on."""
 
-class VirtualMachine:
-    # NOTE: The memory size is mutable, and set as large as the loaded program.
     def __init__(self) -> None:
-        self.mem: List[int] = []
-        self.pc: int = 0
-        self.input: Queue[int] = Queue()
-        self.output: Queue[int] = Queue()
-
-    def load(self, program: List[int]) -> None:
-        self.mem = program[:]  # Deep copy, avoid bugs.
-
-    def rx_from(self, vm: VirtualMachine) -> None:
-        # Must be run *before* manually pushing inputs. Bonus fact: this
-        # function type signature is only possible with __future__.
-        self.input = vm.output
-
-    def push_input(self, inp: int) -> None:
-        self.input.put(inp)
-
-    def pop_output(self) -> int:
-        return self.output.get()
-
-    def execute(self) -> Iterator[State]:
-        """Yield State.BLOCKED or State.HALTED."""
-        while True:
-            op, vals, locs = self.read()
-            if op == Op.ADD:
-                self.mem[locs[2]] = vals[0] + vals[1]
-            elif op == Op.MUL:
-                self.mem[locs[2]] = vals[0] * vals[1]
-            elif op == Op.SAV:
-                while self.input.empty():
-                    yield State.BLOCKED
-                self.mem[locs[0]] = self.input.get()  # Blocking.
-            elif op == Op.OUT:
-                self.output.put(vals[0])
-            elif op == Op.JIT:
-                self.pc = vals[1] if vals[0] else self.pc
-            elif op == Op.JIF:
-                self.pc = vals[1] if not vals[0] else self.pc
-            elif op == Op.LTH:
-                self.mem[locs[2]] = int(vals[0] < vals[1])
-            elif op == Op.EQL:
-                self.mem[locs[2]] = int(vals[0] == vals[1])
-            elif op == Op.HLT:
-                while True:
-                    yield State.HALTED
-            else:
-                raise RuntimeError(f"encountered invalid opcode {op}")
-
-    def read(self) -> Tuple[int, List[int], List[int]]:
-        """Return the opcode, a list of values, and a list of locations."""
-        # Read the current instruction.
-        ins = self.mem[self.pc]
-        self.pc += 1
-        # Determine the opcode.
-        op = ins % 100
-        # Start two lists, for values and locations.
-        vals: List[int] = []
-        locs: List[int] = []
-        # Read each used mode, then save a value and optional location.
-        for i in range(ARITY[Op(op)]):
-            mode = ins // pow(10, 2 + i) % 10
-            if mode == Mode.POS:
-                vals.append(self.mem[self.mem[self.pc]])
-                locs.append(self.mem[self.pc])
-            elif mode == Mode.IMM:
-                vals.append(self.mem[self.pc])
-                locs.append(-1)
-            else:
-                raise RuntimeError(f"encountered invalid mode {mode}")
-            self.pc += 1
-        return op, vals, locs
-
-    def memory_dump(self) -> List[int]:
-        return self.mem[:]  # Deep copy, avoid bugs.
+        self.outputs: Dict[Tuple[str, int, int], int] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def run(self, warm: VirtualMachine, key: str, phase: int,
+            signal: int) -> int:
+        """Return the output of the amplifier forked from warm, which has
+        program digest key, given phase and signal."""
+        output = self.outputs.get((key, phase, signal))
+        if output is not None:
+            self.hits += 1
+            return output
+        self.misses += 1
+        output = chain_signal(warm, [phase], signal)
+        self.outputs[key, phase, signal] = output
+        return output
+
+
+def chain_search(program: List[int],
+                 phases: Sequence[int],
+                 cache: Optional[StageCache] = None) -> int:
+    """Return the best chain_signal() of any ordering of phases.
+
+    Orderings are walked as a prefix tree, so each distinct prefix runs once
+    rather than once per ordering it starts, and every run goes through the
+    cache, so prefixes ending in the same phase and signal share it too.
+    """
+    cache = cache or StageCache()
+    # Every amplifier runs the same prologue before reading its phase, so run
+    # it once and fork.
+    warm = warm_start(program)
+    # Not hash(), which collides for programs as alike as -1 and -2.
+    key = hashlib.sha256(",".join(map(str, program)).encode()).hexdigest()
+
+    def walk(signal: int, rest: List[int]) -> int:
+        if not rest:
+            return signal
+        return max(
+            walk(cache.run(warm, key, phase, signal),
+                 [p for p in rest if p != phase]) for phase in rest)
+
+    return max(0, walk(0, list(phases)))
+
+
+# Per-process state for search() workers, set once by start_worker().
+WORKER: Dict[str, Any] = {}
+
+
+def start_worker(program: List[int], signal: Signal) -> None:
+    WORKER["warm"] = warm_start(program)
+    WORKER["signal"] = signal
+
+
+def best_with_prefix(task: Tuple[Tuple[int, ...], List[int]]) -> int:
+    """Return the best signal of any ordering of phases that starts with
+    prefix, and then has the rest in some order."""
+    prefix, rest = task
+    warm, signal = WORKER["warm"], WORKER["signal"]
+    best_signal = 0
+    for permutation in itertools.permutations(rest):
+        best_signal = max(best_signal, signal(warm, prefix + permutation))
+    return best_signal
 
 
-def simulate(vms: List[VirtualMachine]) -> List[VirtualMachine]:
-    running_vms = [vm.execute() for vm in vms]
-    while True:
-        for i, r in enumerate(running_vms):
-            state = next(r)
-            if (i == len(vms) - 1) and (state == State.HALTED):
-                return vms
+def search(program: List[int],
+           phases: Sequence[int],
+           signal: Signal = chain_signal,
+           workers: Optional[int] = None) -> int:
+    """Return the best signal of any ordering of phases, trying them across
+    workers processes, or every CPU if None.
+
+    The program goes to each worker once, and each task is every ordering
+    with a given prefix. Prefixes are just long enough to make several tasks
+    per worker, so they balance without costing much to send.
+    """
+    workers = workers or os.cpu_count() or 1
+    count, length = 1, 0
+    while count < 4 * workers and length < len(phases):
+        count *= len(phases) - length
+        length += 1
+    tasks = [(prefix, [p for p in phases if p not in prefix])
+             for prefix in itertools.permutations(phases, length)]
+    if workers == 1:
+        start_worker(program, signal)
+        return max(map(best_with_prefix, tasks), default=0)
+    with multiprocessing.Pool(workers, start_worker,
+                              (program, signal)) as pool:
+        return max(pool.imap_unordered(best_with_prefix, tasks), default=0)
 
 
 def part_1(program: List[int]) -> int:
-    best_signal = 0
-    for permutation in itertools.permutations(range(5)):
-        signal = 0
-        for phase in permutation:
-            vm = VirtualMachine()
-            vm.load(program)
-            vm.push_input(phase)
-            vm.push_input(signal)
-            _ = next(vm.execute())
-            signal = vm.pop_output()
-        best_signal = max(best_signal, signal)
-    return best_signal
+    return chain_search(program, range(5))
 
 
 def part_2(program: List[int]) -> int:
+    warm = warm_start(program)
     best_signal = 0
     for permutation in itertools.permutations(range(5, 10)):
-        # Create enough VMs.
-        vms = [VirtualMachine() for _ in range(len(permutation))]
-        # Have each VM load the program.
-        for vm in vms:
-            vm.load(program)
-        # Set each VM to recieve input from the VM immediately before it.
-        for i, vm in enumerate(vms):
-            vm.rx_from(vms[(i - 1) % len(vms)])  # -1 % 5 == 4
-        # Push each phase input to its respective VM input queue.
-        for i, phase in enumerate(permutation):
-            vms[i].push_input(phase)
-        # Push the initial 0 signal to the first VM.
-        vms[0].push_input(0)
-        # Execute all VMs.
-        vms = simulate(vms)
-        # Get the output from the last VM, and see if it's any better.
-        signal = vms[-1].pop_output()
-        best_signal = max(best_signal, signal)
+        best_signal = max(best_signal, feedback_signal(warm, permutation))
     return best_signal
 
 
-def parse(s: str) -> List[int]:
-    return [int(n) for n in s.split(",")]
-
-
 def test_cases_part_1() -> None:
     cases = [
         (
@@ -204,9 +192,55 @@ def test_cases_part_2() -> None:
         assert part_2(parse(x)) == y
 
 
+def test_simulate_deadlock() -> None:
+    """Does a loop whose last amplifier never gets input raise?"""
+    vms = [VirtualMachine() for _ in range(2)]
+    for vm in vms:
+        vm.load(parse("3,0,3,0,4,0,99"))
+    vms[1].rx_from(vms[0])
+    vms[0].rx_from(vms[1])
+    vms[0].push_input(1)
+    with pytest.raises(RuntimeError):
+        simulate(vms)
+
+
+def test_search() -> None:
+    """Does the parallel search agree with the serial one?"""
+    program = read_program("input/07.txt")
+
+    assert search(program, range(5), workers=2) == 117312
+    assert search(program, range(5, 10), feedback_signal, workers=2) == 1336480
+    # Seven amplifiers, each appending its phase as a digit.
+    program = parse("3,15,3,16,1002,16,10,16,1,16,15,15,4,15,99,0,0")
+    assert search(program, range(7), workers=1) == 6543210
+    assert search(program, range(7), workers=3) == 6543210
+
+
+def test_chain_search() -> None:
+    program = read_program("input/07.txt")
+
+    cache = StageCache()
+    assert chain_search(program, range(5), cache) == 117312
+    # 5 + 20 + 60 + 120 + 120 prefixes, but far fewer distinct stages.
+    assert cache.hits + cache.misses == 325
+    assert cache.misses < 325
+    misses = cache.misses
+    assert chain_search(program, range(5), cache) == 117312
+    assert cache.misses == misses
+    program = parse("3,15,3,16,1002,16,10,16,1,16,15,15,4,15,99,0,0")
+    want = search(program, range(7), workers=1)
+    assert chain_search(program, range(7)) == want
+    # Programs differing only in a -1 or -2 share a cache, but not results.
+    cache = StageCache()
+    for d in (1, 2):
+        program = parse("3,21,3,22,1002,22,10,22,1,22,21,21,"
+                        f"1001,21,-{d},21,4,21,99,0,0")
+        want = search(program, range(5), workers=1)
+        assert chain_search(program, range(5), cache) == want
+
+
 def test_solutions() -> None:
-    with open("input/07.txt") as f:
-        program = parse(f.read())
+    program = read_program("input/07.txt")
 
     assert part_1(program) == 117312
     assert part_2(program) == 1336480
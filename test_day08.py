@@ -1,6 +1,16 @@
 import enum
+import random
 from typing import Any, List
 
+import pytest
+
+try:
+    import numpy as np
+except ImportError:
+    HAS_NUMPY = False
+else:
+    HAS_NUMPY = True
+
 
 class Color(enum.IntEnum):
     BLACK = 0
@@ -46,6 +56,37 @@ def part_2(digits: List[int], w: int, h: int) -> str:
     return show(collapse(layers), w)
 
 
+def read_layers(digits: str, w: int, h: int) -> Any:
+    """Read a digit string straight into a (layers, h, w) array."""
+    pixels = np.frombuffer(digits.strip().encode(), dtype=np.uint8) - ord("0")
+    return pixels.reshape(-1, h, w)
+
+
+def part_1_numpy(digits: str, w: int, h: int) -> int:
+    """Like part_1, but vectorized with NumPy."""
+    layers = read_layers(digits, w, h).reshape(-1, w * h)
+    # Counts of 0, 1 and 2 in every layer, a pass over all of them for each.
+    zeros, ones, twos = (np.count_nonzero(layers == d, axis=1)
+                         for d in range(3))
+    layer = zeros.argmin()
+    return int(ones[layer] * twos[layer])
+
+
+def collapse_numpy(layers: Any) -> Any:
+    """Like collapse, for a (layers, h, w) array, returning an (h, w) one."""
+    colored = layers != Color.CLEAR
+    # The first colored layer of each pixel, or 0 if none is.
+    first = colored.argmax(axis=0)
+    pixels = np.take_along_axis(layers, first[None], axis=0)[0]
+    return np.where(colored.any(axis=0), pixels, Color.CLEAR)
+
+
+def part_2_numpy(digits: str, w: int, h: int) -> str:
+    """Like part_2, but vectorized with NumPy."""
+    view = collapse_numpy(read_layers(digits, w, h))
+    return show(view.ravel().tolist(), w)
+
+
 def test_cases_part_2() -> None:
     digits, w, h = [0, 2, 2, 2, 1, 1, 2, 2, 2, 2, 1, 2, 0, 0, 0, 0], 2, 2
     answer = "01\n10"
@@ -53,6 +94,22 @@ def test_cases_part_2() -> None:
     assert part_2(digits, w, h) == answer
 
 
+@pytest.mark.skipif(not HAS_NUMPY, reason="needs NumPy")
+def test_numpy() -> None:
+    """Does the NumPy path give identical outputs?"""
+    rng = random.Random(8)
+    for w, h, n in [(2, 2, 4), (25, 6, 100), (3, 5, 1), (7, 3, 50)]:
+        digits = [rng.choice((0, 1, 2, 2, 2, 2)) for _ in range(w * h * n)]
+        text = "".join(map(str, digits))
+        assert part_1_numpy(text, w, h) == part_1(digits, w, h)
+        assert part_2_numpy(text, w, h) == part_2(digits, w, h)
+    with open("input/08.txt") as f:
+        text = f.read()
+    digits = [int(c) for c in text.strip()]
+    assert part_1_numpy(text, 25, 6) == part_1(digits, 25, 6)
+    assert part_2_numpy(text, 25, 6) == part_2(digits, 25, 6)
+
+
 def test_solutions() -> None:
     with open("input/08.txt") as f:
         digits = [int(c) for c in f.read().strip()]
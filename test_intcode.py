@@ -0,0 +1,311 @@
+import asyncio
+import json
+import threading
+from pathlib import Path
+from typing import List
+
+import pytest
+
+from intcode import (PAGE_SIZE, Channel, Profile, Scheduler, State,
+                     ThreadSafeChannel, VirtualMachine, aio, image, parse,
+                     read_program, warm_start)
+
+
+def test_resume_after_blocking() -> None:
+    """Does a fresh generator retry the SAV that blocked the last one?"""
+    vm = VirtualMachine()
+    vm.load(parse("3,0,4,0,99"))
+    assert next(vm.execute()) == State.BLOCKED
+    vm.push_input(1337)
+    vm.exhaust()
+    assert list(vm.drain()) == [1337]
+    assert vm.steps == 2
+
+
+def test_exhaust_blocked() -> None:
+    vm = VirtualMachine()
+    vm.load(parse("3,0,99"))
+    with pytest.raises(RuntimeError):
+        vm.exhaust()
+
+
+def test_invalid_opcode() -> None:
+    vm = VirtualMachine()
+    vm.load(parse("42,99"))
+    with pytest.raises(RuntimeError):
+        vm.exhaust()
+
+
+def test_self_modifying() -> None:
+    """Is a cached instruction re-decoded after the program overwrites it?"""
+    # yapf: disable
+    program = [
+        4, 17,  # Output cell 17, then cell 18.
+        1005, 20, 16,  # Halt on the second pass.
+        1101, 0, 18, 1,  # Overwrite the 17.
+        1101, 0, 1, 20,  # Mark the second pass.
+        1105, 1, 0,  # Loop.
+        99,
+        7,
+        8,
+    ]
+    # yapf: enable
+    vm = VirtualMachine()
+    vm.load(program)
+    vm.exhaust()
+    assert list(vm.drain()) == [7, 8]
+
+
+def test_external_write() -> None:
+    vm = VirtualMachine()
+    vm.load(parse("4,3,99,7,9"))
+    vm.exhaust()
+    vm.mem[1] = 4
+    vm.pc = 0
+    vm.exhaust()
+    assert list(vm.drain()) == [7, 9]
+
+
+def test_jit_blocks() -> None:
+    """Do compiled blocks agree with the interpreter?"""
+    with open("input/09.txt") as f:
+        program = parse(f.read())
+
+    for program_input in (1, 2):
+        outputs = []
+        for jit_blocks in (False, True):
+            vm = VirtualMachine(jit_blocks)
+            vm.load(program)
+            vm.push_input(program_input)
+            vm.exhaust()
+            outputs.append((list(vm.drain()), vm.steps))
+        assert outputs[0] == outputs[1]
+
+
+def test_jit_self_modifying() -> None:
+    # yapf: disable
+    program = [
+        4, 17,  # Output cell 17, then cell 18.
+        1005, 20, 16,  # Halt on the second pass.
+        1101, 0, 18, 1,  # Overwrite the 17.
+        1101, 0, 1, 20,  # Mark the second pass.
+        1105, 1, 0,  # Loop.
+        99,
+        7,
+        8,
+    ]
+    # yapf: enable
+    vm = VirtualMachine(jit_blocks=True)
+    vm.load(program)
+    vm.exhaust()
+    assert list(vm.drain()) == [7, 8]
+    assert vm.mem.unstable
+
+
+def test_huge_addresses() -> None:
+    """Do far addresses work, and do reads leave memory unallocated?"""
+    for jit_blocks in (False, True):
+        vm = VirtualMachine(jit_blocks)
+        vm.load(parse("4,123456789,1101,5,6,1000000000000,4,1000000000000,99"))
+        vm.exhaust()
+        assert list(vm.drain()) == [0, 11]
+        assert 123456789 >> 9 not in vm.mem.owned
+        assert 1000000000000 >> 9 in vm.mem.owned
+
+
+def test_far_read_dump() -> None:
+    """Does a dump after a far read only cover the pages holding data?"""
+    vm = VirtualMachine()
+    vm.load(parse("4,1000000000000,99"))
+    vm.exhaust()
+    assert list(vm.drain()) == [0]
+    assert vm.memory_dump() == [4, 1000000000000, 99] + [0] * (PAGE_SIZE - 3)
+    assert vm.memory_dump(3) == [4, 1000000000000, 99]
+    assert vm.memory_dump(PAGE_SIZE + 1)[-2:] == [0, 0]
+
+
+def test_fork() -> None:
+    """Do forks share memory until written, then diverge?"""
+    warm = warm_start(parse("3,9,1001,9,1,9,4,9,99,0"))
+    forks = [warm.fork() for _ in range(3)]
+    assert all(vm.mem.pages[0] is warm.mem.pages[0] for vm in forks)
+    for i, vm in enumerate(forks):
+        vm.push_input(10 * i)
+        vm.exhaust()
+        assert list(vm.drain()) == [10 * i + 1]
+    assert warm.mem[9] == 0
+    assert not any(vm.mem.pages[0] is warm.mem.pages[0] for vm in forks)
+
+
+def test_warm_start_limit() -> None:
+    """Does warming up a program that never reads input stop?"""
+    warm = warm_start(parse("1105,1,0"), limit=1000)
+    assert 1000 <= warm.steps < 2000
+    assert warm.quantum is None
+    warm = warm_start(parse("104,7,1105,1,2"))
+    assert list(warm.fork().drain()) == [7]
+
+
+def test_channel() -> None:
+    a, b = Channel(), Channel()
+    a.push_many([1, 2])
+    a.put(3)
+    b.put(0)
+    assert a.drain_into(b) == 3
+    assert a.empty() and list(b) == [0, 1, 2, 3]
+    assert b.get() == 0
+    with pytest.raises(RuntimeError):
+        a.wait()
+
+
+def test_threads() -> None:
+    """Does the day 7 feedback loop work with every VM on its own thread?"""
+    program = parse("3,26,1001,26,-4,26,3,27,1002,27,2,27,1,27,26,27,4,27,"
+                    "1001,28,-1,28,1005,28,6,99,0,0,5")
+    vms = [VirtualMachine(channel=ThreadSafeChannel) for _ in range(5)]
+    for i, vm in enumerate(vms):
+        vm.load(program)
+        vm.rx_from(vms[i - 1])
+    for vm, phase in zip(vms, [9, 8, 7, 6, 5]):
+        vm.push_input(phase)
+    vms[0].push_input(0)
+    threads = [threading.Thread(target=vm.exhaust) for vm in vms]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert vms[-1].pop_output() == 139629729
+
+
+def test_aio() -> None:
+    """Does the day 7 feedback loop work with every VM as a task?"""
+    program = parse("3,26,1001,26,-4,26,3,27,1002,27,2,27,1,27,26,27,4,27,"
+                    "1001,28,-1,28,1005,28,6,99,0,0,5")
+
+    async def network() -> int:
+        wires: List[asyncio.Queue[int]] = [asyncio.Queue() for _ in range(5)]
+        for wire, phase in zip(wires, [9, 8, 7, 6, 5]):
+            wire.put_nowait(phase)
+        wires[0].put_nowait(0)
+        tasks = []
+        for i, wire in enumerate(wires):
+            vm = VirtualMachine()
+            vm.load(program)
+            sink = wires[(i + 1) % len(wires)]
+            tasks.append(aio.run(vm, wire.get, sink.put))
+        await asyncio.gather(*tasks)
+        return wires[0].get_nowait()
+
+    assert asyncio.run(network()) == 139629729
+
+
+def test_aio_yields() -> None:
+    """Does a VM that never blocks let other tasks run before it halts?"""
+    vm = VirtualMachine()
+    vm.load([1001, 8, -1, 8, 1005, 8, 0, 99, 100000])  # Count down.
+    seen = []
+
+    async def source() -> int:
+        raise AssertionError("never reads input")
+
+    async def sink(value: int) -> None:
+        raise AssertionError(f"never outputs, but got {value}")
+
+    async def watch() -> None:
+        seen.append(vm.steps)
+
+    async def main() -> None:
+        await asyncio.gather(aio.run(vm, source, sink), watch())
+
+    asyncio.run(main())
+    assert 0 < seen[0] < vm.steps
+
+
+@pytest.mark.parametrize("jit_blocks", [False, True])
+def test_preempted(jit_blocks: bool) -> None:
+    """Does a VM that never blocks stop after its quantum?"""
+    vm = VirtualMachine(jit_blocks)
+    vm.load(parse("1001,9,1,9,1105,1,0,99,0,0"))  # Count in cell 9, forever.
+    vm.quantum = 10
+    execution = vm.execute()
+    assert next(execution) == State.PREEMPTED
+    assert 10 <= vm.steps <= 12
+    assert next(execution) == State.PREEMPTED
+    assert 20 <= vm.steps <= 24
+    assert vm.mem[9] == vm.steps // 2
+
+
+def test_scheduler_fair() -> None:
+    """Does an endless VM share its turns with a pipeline that finishes?"""
+    busy = VirtualMachine()
+    busy.load(parse("1001,9,1,9,1105,1,0,99,0,0"))
+    vms = [VirtualMachine() for _ in range(3)]
+    for i, vm in enumerate(vms):
+        vm.load(parse("3,0,4,0,99"))
+        if i:
+            vm.rx_from(vms[i - 1])
+    vms[0].push_input(7)
+    Scheduler([busy] + vms, quantum=100).run(until=vms[-1])
+    assert vms[-1].pop_output() == 7
+    assert busy.steps < 200
+
+
+def test_profile() -> None:
+    # Count down from cell 11, outputting each value.
+    program = parse("4,11,1001,11,-1,11,1005,11,0,99,0,3")
+    vm = VirtualMachine()
+    vm.load(program)
+    vm.profile = Profile()
+    vm.exhaust()
+    assert list(vm.drain()) == [3, 2, 1]
+    dump = json.loads(json.dumps(vm.profile.dump()))
+    assert dump["instructions"] == vm.steps == 9
+    assert dump["ops"] == {"ADD": 3, "JIT": 3, "OUT": 3}
+    assert dump["pcs"] == {"0": 3, "2": 3, "6": 3}
+    assert dump["cells_touched"] == 10
+    assert dump["hot_loops"] == [{
+        "start": 0,
+        "end": 9,
+        "iterations": 2,
+        "instructions": 9,
+    }]
+
+
+def test_image(tmp_path: Path) -> None:
+    program = [1, -5, 2**63 - 1, -2**63, 2**64, -2**70, 99]
+    assert image.loads(image.dumps(program)) == program
+    text, binary = tmp_path / "program.txt", tmp_path / "program.icim"
+    text.write_text(",".join(map(str, program)) + "\n")
+    image.convert(str(text), str(binary))
+    assert read_program(str(text)) == read_program(str(binary)) == program
+    # Cached, but copied, so changing one doesn't change the next.
+    read_program(str(binary))[0] = 2
+    assert read_program(str(binary)) == program
+
+
+@pytest.mark.parametrize("jit_blocks", [False, True])
+def test_int64_overflow(jit_blocks: bool) -> None:
+    """Does a page that can't hold a result get promoted?"""
+    vm = VirtualMachine(jit_blocks)
+    vm.load([1002, 9, 4, 9, 4, 9, 99, 0, 0, 2**62])
+    vm.exhaust()
+    assert list(vm.drain()) == [2**64]
+    vm.load([4, 3, 99, -2**70])
+    vm.exhaust()
+    assert list(vm.drain()) == [-2**70]
+
+
+def test_memory_views() -> None:
+    vm = VirtualMachine()
+    vm.load([3, 7, 3, 1000, 99, 0, 0, 0])
+    address, cells = next(vm.memory_views())
+    assert address == 0 and list(cells[:5]) == [3, 7, 3, 1000, 99]
+    with pytest.raises(TypeError):
+        cells[0] = 4  # type: ignore
+    vm.push_input(5)
+    vm.push_input(6)
+    vm.exhaust()
+    # Live, since the loaded page was already writable.
+    assert cells[7] == 5
+    assert [address for address, _ in vm.memory_views()] == [0, 512]
+    assert dict(vm.memory_views())[512][1000 - 512] == 6